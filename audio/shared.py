@@ -4,11 +4,13 @@ from redbot.core.i18n import Translator
 from redbot.core.utils.chat_formatting import humanize_list
 
 from pylav.core.client import Client
+from pylav.type_hints.bot import DISCORD_BOT_TYPE
 
 _ = Translator("PyLavPlayer", Path(__file__))
 
 
 class SharedMethods:
+    bot: DISCORD_BOT_TYPE
     pylav: Client
 
     async def _process_play_message(self, context, single_track, total_tracks_enqueue, queries):
@@ -35,7 +37,10 @@ class SharedMethods:
                         track_name_variable_do_not_translate=await single_track.get_track_display_name(with_url=True)
                     )
                 artwork = await single_track.artworkUrl()
-                file = await single_track.get_embedded_artwork()
+                if (local_files := self.bot.get_cog("PyLavLocalFiles")) is not None:
+                    file = await local_files.get_embedded_artwork(single_track)
+                else:
+                    file = await single_track.get_embedded_artwork()
             case 0:
                 if len(queries) == 1:
                     description = _(
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import os
+from pathlib import Path
+
+import discord
+from expiringdict import ExpiringDict
+
+from pylav.compat import json
+from pylav.logging import getLogger
+from pylav.players.tracks.obj import Track
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+LOGGER = getLogger("PyLav.cog.LocalFiles.Artwork")
+
+THUMBNAIL_SIZE = 256
+MAX_CACHE_SIZE = 64 * 1024 * 1024
+INDEX_FILE_NAME = "index.json"
+# Tracks known to have no embedded artwork are remembered for this long, up to this many of them
+WITHOUT_ARTWORK_MAX_AGE = 3600
+WITHOUT_ARTWORK_MAX_LEN = 10000
+
+
+async def is_local_track(track: Track) -> bool:
+    return (query := await track.query()) is not None and query.is_local
+
+
+def make_thumbnail(data: bytes) -> bytes:
+    """Downscale an image keeping its format, returns the input unchanged if Pillow is not installed"""
+    if Image is None:
+        return data
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if max(image.size) <= THUMBNAIL_SIZE:
+                return data
+            image_format = image.format
+            image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            buffer = io.BytesIO()
+            image.save(buffer, format=image_format)
+            return buffer.getvalue()
+    except Exception as exc:
+        LOGGER.debug("Failed to downscale embedded artwork", exc_info=exc)
+        return data
+
+
+class ArtworkThumbnailCache:
+    """A size bounded, content-addressed cache of downscaled embedded artwork"""
+
+    def __init__(self, folder: Path, max_size: int = MAX_CACHE_SIZE) -> None:
+        self.folder = folder
+        self.max_size = max_size
+        # track key -> (blob name, filename of the original attachment)
+        self._entries: dict[str, tuple[str, str]] | None = None
+        self._without_artwork = ExpiringDict(
+            max_len=WITHOUT_ARTWORK_MAX_LEN, max_age_seconds=WITHOUT_ARTWORK_MAX_AGE
+        )  # type: ignore
+        self._tasks: set[asyncio.Task[None]] = set()
+        self._lock = asyncio.Lock()
+
+    def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+
+    def _load(self) -> dict[str, tuple[str, str]]:
+        try:
+            with (self.folder / INDEX_FILE_NAME).open("rb") as fp:
+                return {key: tuple(value) for key, value in json.loads(fp.read()).items()}
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self) -> None:
+        temp = self.folder / f"{INDEX_FILE_NAME}.tmp"
+        with temp.open("w", encoding="utf-8") as fp:
+            fp.write(json.dumps(self._entries))
+        os.replace(temp, self.folder / INDEX_FILE_NAME)
+
+    def _read(self, blob: str) -> bytes | None:
+        path = self.folder / blob
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        # Bump the mtime, eviction removes the least recently used blobs first
+        os.utime(path)
+        return data
+
+    def _write(self, key: str, filename: str, data: bytes) -> None:
+        thumbnail = make_thumbnail(data)
+        blob = f"{hashlib.sha256(thumbnail).hexdigest()}{os.path.splitext(filename)[1]}"
+        self.folder.mkdir(parents=True, exist_ok=True)
+        if not (path := self.folder / blob).exists():
+            path.write_bytes(thumbnail)
+        self._entries[key] = (blob, filename)
+        self._evict()
+        self._save()
+
+    def _evict(self) -> None:
+        blobs = sorted(
+            (
+                entry
+                for entry in os.scandir(self.folder)
+                if entry.is_file() and not entry.name.startswith(INDEX_FILE_NAME)
+            ),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        total = sum(entry.stat().st_size for entry in blobs)
+        evicted = set()
+        for entry in blobs:
+            if total <= self.max_size:
+                break
+            total -= entry.stat().st_size
+            evicted.add(entry.name)
+            os.remove(entry.path)
+        if evicted:
+            self._entries = {key: value for key, value in self._entries.items() if value[0] not in evicted}
+
+    async def _store(self, key: str, filename: str, data: bytes) -> None:
+        async with self._lock:
+            try:
+                await asyncio.to_thread(self._write, key, filename, data)
+            except OSError as exc:
+                LOGGER.warning("Failed to cache embedded artwork", exc_info=exc)
+
+    async def get(self, track: Track) -> discord.File:
+        """Return the embedded artwork of a track, using the cached thumbnail once one has been made
+
+        Only local tracks are cached, any other track is passed straight through.
+        """
+        if not track.encoded or not await is_local_track(track):
+            return await track.get_embedded_artwork()
+        key = hashlib.sha1(track.encoded.encode()).hexdigest()
+        if key in self._without_artwork:
+            return discord.utils.MISSING
+        if self._entries is None:
+            self._entries = await asyncio.to_thread(self._load)
+        if (entry := self._entries.get(key)) is not None:
+            blob, filename = entry
+            if (data := await asyncio.to_thread(self._read, blob)) is not None:
+                return discord.File(io.BytesIO(data), filename=filename)
+        if not (file := await track.get_embedded_artwork()):
+            self._without_artwork[key] = True
+            return discord.utils.MISSING
+        data = file.fp.read()
+        file.reset()
+        task = asyncio.create_task(self._store(key, file.filename, data))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return file
@@ -1,17 +1,18 @@
 from __future__ import annotations
 
-import heapq
-import os.path
-import re
+import asyncio
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
-from itertools import islice
 from pathlib import Path
 
 import discord
 from discord import app_commands
 from discord.app_commands import AppCommandError, Choice, CommandOnCooldown, Cooldown
-from rapidfuzz import fuzz
-from redbot.core import commands
+from expiringdict import ExpiringDict
+from redbot.core import Config, commands
+from redbot.core.data_manager import cog_data_path
 from redbot.core.i18n import Translator, cog_i18n
 from redbot.core.utils.chat_formatting import box
 from tabulate import tabulate
@@ -21,15 +22,26 @@ from pylav.extension.red.utils import rgetattr
 from pylav.helpers.format.ascii import EightBitANSI
 from pylav.helpers.format.strings import shorten_string
 from pylav.logging import getLogger
+from pylav.players.player import Player
 from pylav.players.query.obj import Query
+from pylav.players.tracks.obj import Track
 from pylav.type_hints.bot import DISCORD_BOT_TYPE, DISCORD_COG_TYPE_MIXIN, DISCORD_INTERACTION_TYPE
 
+from pllocal.artwork import ArtworkThumbnailCache
+from pllocal.index import LocalTrackIndex, SearchCancelled, SearchMemo, check_cancelled
+from pllocal.metadata import LocalMetadataIndex, merge_rankings
+from pllocal.refresh import LocalTracksRefresher
+
 LOGGER = getLogger("PyLav.cog.LocalFiles")
 
 
 _ = Translator("PyLavLocalFiles", Path(__file__))
 
-REGEX_FILE_NAME = re.compile(r"[.\-_/\\ ]+")
+# Discord drops autocomplete responses after 3 seconds, leave room to build the choices and send them
+AUTOCOMPLETE_DEADLINE = 2.0
+FOLDER_ENQUEUE_CHUNK = 100
+# Searches run on their own threads so that superseded ones never hold up PyLav's default executor
+SEARCH_WORKERS = 2
 
 
 async def cache_filled(interaction: DISCORD_INTERACTION_TYPE) -> bool:
@@ -39,9 +51,9 @@ async def cache_filled(interaction: DISCORD_INTERACTION_TYPE) -> bool:
         return False
     if not (cache := rgetattr(cog, "pylav.local_tracks_cache", None)):
         return False
-    if not cache.is_ready:
+    if not (cache.is_ready or cog.has_local_index):
         raise CommandOnCooldown(Cooldown(1, 1), 60)
-    return cache.is_ready
+    return True
 
 
 @cog_i18n(_)
@@ -53,11 +65,72 @@ class PyLavLocalFiles(DISCORD_COG_TYPE_MIXIN):
     def __init__(self, bot: DISCORD_BOT_TYPE, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.bot = bot
+        self._config = Config.get_conf(self, identifier=208903205982044161)
+        self._config.register_global(watch_local_tracks=False)
+        self._refresher = LocalTracksRefresher(self.bot, cog_data_path(self) / "local_tracks_manifest.json")
+        self._snapshot_file = cog_data_path(self) / "local_tracks_index.bin"
+        self._metadata = LocalMetadataIndex(cog_data_path(self) / "local_tracks_metadata.db")
+        self._metadata_task: asyncio.Task[None] | None = None
+        self._artwork = ArtworkThumbnailCache(cog_data_path(self) / "artwork")
+        self._local_index: LocalTrackIndex | None = None
+        self._local_index_task: asyncio.Task[LocalTrackIndex] | None = None
+        self._finish_index_task: asyncio.Task[None] | None = None
+        self._reconcile_task: asyncio.Task[None] | None = None
+        self._autocomplete_tasks: dict[
+            int, tuple[asyncio.Future[tuple[list[str], SearchMemo | None]], threading.Event]
+        ] = {}
+        self._search_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="PyLavLocalSearch")
+        self._autocomplete_memo = ExpiringDict(max_len=1000, max_age_seconds=5)  # type: ignore
+
+    async def initialize(self) -> None:
+        await self.pylav.wait_until_ready()
+        if self._local_index is None:
+            self._local_index = await asyncio.to_thread(
+                LocalTrackIndex.load, self._snapshot_file, await self._refresher.root_folder()
+            )
+            if self._local_index is not None:
+                LOGGER.info("Loaded %s local tracks from the last snapshot", len(self._local_index))
+        self._reconcile_task = asyncio.create_task(self._reconcile_local_index())
+        if await self._config.watch_local_tracks():
+            self._refresher.start_watching(on_change=self.rebuild_local_index)
+
+    async def _reconcile_local_index(self) -> None:
+        while not self.pylav.local_tracks_cache.is_ready:
+            await asyncio.sleep(1)
+        await self.rebuild_local_index()
+
+    async def cog_unload(self) -> None:
+        await self._refresher.stop_watching()
+        if self._reconcile_task is not None:
+            self._reconcile_task.cancel()
+        if self._local_index_task is not None:
+            self._local_index_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._local_index_task
+        if self._finish_index_task is not None:
+            self._finish_index_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._finish_index_task
+        if self._metadata_task is not None:
+            self._metadata_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._metadata_task
+        self._metadata.close()
+        self._artwork.close()
+        for task, cancelled in self._autocomplete_tasks.values():
+            cancelled.set()
+            task.cancel()
+        self._autocomplete_tasks.clear()
+        self._search_executor.shutdown(wait=False, cancel_futures=True)
 
     async def cog_check(self, ctx: PyLavContext):
         if not (cache := rgetattr(self, "pylav.local_tracks_cache", None)):
             return False
-        return cache.is_ready
+        return cache.is_ready or self.has_local_index
+
+    @property
+    def has_local_index(self) -> bool:
+        return self._local_index is not None and len(self._local_index) > 0
 
     @commands.group(name="pllocalset")
     async def command_pllocalset(self, ctx: PyLavContext):
@@ -95,13 +168,18 @@ class PyLavLocalFiles(DISCORD_COG_TYPE_MIXIN):
 
     @command_pllocalset.command(name="update")
     @commands.is_owner()
-    async def command_pllocalset_update(self, context: PyLavContext) -> None:
-        """Update the track list for /local"""
+    async def command_pllocalset_update(self, context: PyLavContext, full: bool = False) -> None:
+        """Update the track list for /local
+
+        Only folders that changed since the last update are rescanned, set `full` to rebuild the whole list.
+        """
         if isinstance(context, discord.Interaction):
             context = await self.cog.bot.get_context(context)
         if context.interaction and not context.interaction.response.is_done():
             await context.defer(ephemeral=True)
-        await self.pylav.local_tracks_cache.update()
+        if full or await self._refresher.refresh() is None:
+            await self._refresher.rebuild()
+        await self.rebuild_local_index()
         await context.send(
             embed=await self.pylav.construct_embed(
                 description=shorten_string(
@@ -115,6 +193,174 @@ class PyLavLocalFiles(DISCORD_COG_TYPE_MIXIN):
             ephemeral=True,
         )
 
+    @command_pllocalset.command(name="watch")
+    @commands.is_owner()
+    async def command_pllocalset_watch(self, context: PyLavContext) -> None:
+        """Toggle whether changes to the local tracks folder are picked up as they happen"""
+        if isinstance(context, discord.Interaction):
+            context = await self.bot.get_context(context)
+        if context.interaction and not context.interaction.response.is_done():
+            await context.defer(ephemeral=True)
+        if self._refresher.is_watching:
+            await self._refresher.stop_watching()
+            await self._config.watch_local_tracks.set(False)
+            description = _("I will no longer watch the local tracks folder for changes.")
+        elif self._refresher.start_watching(on_change=self.rebuild_local_index):
+            await self._config.watch_local_tracks.set(True)
+            description = _("I will now watch the local tracks folder and update the local track cache as it changes.")
+        else:
+            description = _("I am unable to watch the local tracks folder, the `watchfiles` package is not installed.")
+        await context.send(
+            embed=await self.pylav.construct_embed(description=description, messageable=context),
+            ephemeral=True,
+        )
+
+    async def get_embedded_artwork(self, track: Track) -> discord.File:
+        """Return the embedded artwork of a track as a cached thumbnail, for use by other cogs too"""
+        return await self._artwork.get(track)
+
+    @staticmethod
+    async def _display_name(query: Query) -> str:
+        return await query.query_to_string(max_length=90, with_emoji=True, no_extension=True, add_ellipsis=True)
+
+    async def _compute_display_names(self, index: LocalTrackIndex, hexdigest_to_query: dict[str, Query]) -> None:
+        for position, hexdigest in enumerate(index.hexdigests):
+            if index.display_names[position] is not None or (query := hexdigest_to_query.get(hexdigest)) is None:
+                continue
+            index.display_names[position] = await self._display_name(query)
+            if position % 100 == 0:
+                await asyncio.sleep(0)
+
+    async def _build_local_index(self) -> LocalTrackIndex:
+        hexdigest_to_query = self.pylav.local_tracks_cache.hexdigest_to_query
+        index = await asyncio.to_thread(LocalTrackIndex.from_cache, hexdigest_to_query)
+        if self._local_index is not None:
+            await asyncio.to_thread(index.reuse_display_names, self._local_index)
+        self._local_index = index
+        LOGGER.debug("Built the local track index with %s entries", len(index))
+        # Searches can use the index right away, missing display names are computed when an entry is shown
+        if self._local_index_task is not None:
+            self._local_index_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._local_index_task
+        if self._finish_index_task is not None:
+            self._finish_index_task.cancel()
+        self._finish_index_task = asyncio.create_task(self._finish_local_index(index, hexdigest_to_query))
+        return index
+
+    async def _finish_local_index(self, index: LocalTrackIndex, hexdigest_to_query: dict[str, Query]) -> None:
+        await self._compute_display_names(index, hexdigest_to_query)
+        if not self.pylav.local_tracks_cache.is_ready:
+            return
+        try:
+            await asyncio.to_thread(index.dump, self._snapshot_file, await self._refresher.root_folder())
+        except OSError as exc:
+            LOGGER.warning("Failed to save the local track index snapshot", exc_info=exc)
+        if self._metadata.available and (self._metadata_task is None or self._metadata_task.done()):
+            self._metadata_task = asyncio.create_task(self._metadata.update(dict(zip(index.hexdigests, index.paths))))
+
+    async def rebuild_local_index(self) -> LocalTrackIndex:
+        """Rebuild the /local search index, sharing any rebuild that is already running"""
+        if self._local_index_task is None or self._local_index_task.done():
+            self._local_index_task = asyncio.create_task(self._build_local_index())
+        return await asyncio.shield(self._local_index_task)
+
+    async def get_local_index(self) -> LocalTrackIndex:
+        """Return the /local search index, scheduling a rebuild if the track cache changed since it was built"""
+        if self._local_index is None:
+            return await self.rebuild_local_index()
+        cache = self.pylav.local_tracks_cache
+        if (
+            cache.is_ready
+            and self._local_index.source_size != len(cache.hexdigest_to_query)
+            and (self._local_index_task is None or self._local_index_task.done())
+        ):
+            self._local_index_task = asyncio.create_task(self._build_local_index())
+        return self._local_index
+
+    def _search_local_index(
+        self, index: LocalTrackIndex, current: str, memo: SearchMemo | None, cancelled: threading.Event
+    ) -> tuple[list[str], SearchMemo | None]:
+        hexdigests, memo = index.search(current, memo=memo, cancelled=cancelled)
+        if current:
+            check_cancelled(cancelled)
+            hexdigests = merge_rankings(hexdigests, self._metadata.search(current))
+        return hexdigests, memo
+
+    async def search_local_index(self, user_id: int, current: str) -> list[str]:
+        """Search the /local index in a worker thread, superseding the previous search from the same user"""
+        if (previous := self._autocomplete_tasks.pop(user_id, None)) is not None:
+            previous[1].set()
+            previous[0].cancel()
+        index = await self.get_local_index()
+        # Cancelling the future does not stop its thread, the token makes the search itself give up
+        cancelled = threading.Event()
+        task = asyncio.ensure_future(
+            asyncio.wait_for(
+                asyncio.get_running_loop().run_in_executor(
+                    self._search_executor,
+                    partial(self._search_local_index, index, current, self._autocomplete_memo.get(user_id), cancelled),
+                ),
+                timeout=AUTOCOMPLETE_DEADLINE,
+            )
+        )
+        self._autocomplete_tasks[user_id] = (task, cancelled)
+        try:
+            await asyncio.wait({task})
+        finally:
+            if self._autocomplete_tasks.get(user_id, (None,))[0] is task:
+                del self._autocomplete_tasks[user_id]
+            if not task.done() or task.cancelled() or task.exception() is not None:
+                cancelled.set()
+        if task.cancelled():
+            return []
+        if isinstance(exc := task.exception(), asyncio.TimeoutError):
+            LOGGER.debug("Local autocomplete for %r missed its deadline", current)
+            return []
+        elif isinstance(exc, SearchCancelled):
+            return []
+        elif exc is not None:
+            raise exc
+        hexdigests, memo = task.result()
+        if memo is not None:
+            self._autocomplete_memo[user_id] = memo
+        return hexdigests
+
+    async def resolve_local_entry(self, hexdigest: str) -> Query | None:
+        """Return the query for an autocompleted entry, falling back to the snapshot while the cache is built"""
+        if (query := self.pylav.local_tracks_cache.hexdigest_to_query.get(hexdigest)) is not None:
+            return query
+        if self._local_index is None or (path := self._local_index.path_of(hexdigest)) is None:
+            return None
+        return await Query.from_string(path)
+
+    async def _enqueue_local_folder(
+        self, player: Player, author: discord.abc.User, hexdigests: list[str]
+    ) -> tuple[Track | None, int]:
+        """Enqueue the tracks of a folder from the index, starting playback as soon as the first one is loaded"""
+        first_track = None
+        count = 0
+        chunks = [hexdigests[:1]] + [
+            hexdigests[start : start + FOLDER_ENQUEUE_CHUNK]
+            for start in range(1, len(hexdigests), FOLDER_ENQUEUE_CHUNK)
+        ]
+        for chunk in chunks:
+            queries = [query for hexdigest in chunk if (query := await self.resolve_local_entry(hexdigest))]
+            if not queries:
+                continue
+            successful, loaded, __ = await self.pylav.get_all_tracks_for_queries(
+                *queries, requester=author, player=player
+            )
+            if not loaded:
+                continue
+            await player.bulk_add(requester=author.id, tracks_and_queries=successful)
+            if first_track is None:
+                first_track = successful[0]
+                if not (player.is_active or player.queue.empty()):
+                    await player.next(requester=author)
+            count += loaded
+        return first_track, count
+
     @app_commands.command(
         name="local",
         description=shorten_string(max_length=100, string=_("Play a local file or folder, supports partial searching")),
@@ -139,7 +385,7 @@ class PyLavLocalFiles(DISCORD_COG_TYPE_MIXIN):
             await interaction.response.defer(ephemeral=True)
         send = partial(interaction.followup.send, wait=True)
         author = interaction.user
-        if entry not in self.pylav.local_tracks_cache.hexdigest_to_query:
+        if (query := await self.resolve_local_entry(entry)) is None:
             await send(
                 embed=await self.pylav.construct_embed(
                     description=_(
@@ -150,8 +396,7 @@ class PyLavLocalFiles(DISCORD_COG_TYPE_MIXIN):
                 ephemeral=True,
             )
             return
-        entry = self.pylav.local_tracks_cache.hexdigest_to_query[entry]
-        entry._recursive = recursive
+        query._recursive = recursive
         player = self.pylav.get_player(interaction.guild.id)
         if player is None:
             config = self.pylav.player_config_manager.get_config(interaction.guild.id)
@@ -183,17 +428,20 @@ class PyLavLocalFiles(DISCORD_COG_TYPE_MIXIN):
                 return
             player = await self.pylav.connect_player(channel=channel, requester=author)
 
-        successful, count, failed = await self.pylav.get_all_tracks_for_queries(
-            entry,
-            requester=author,
-            player=player,
-        )
-        if count:
-            if count == 1:
-                await player.add(requester=author.id, track=successful[0])
-            else:
-                await player.bulk_add(requester=author.id, tracks_and_queries=successful)
-        single_track = successful[0] if successful else None
+        if self._local_index is not None and (tracks := self._local_index.folder_tracks(entry, recursive)) is not None:
+            single_track, count = await self._enqueue_local_folder(player, author, tracks)
+        else:
+            successful, count, failed = await self.pylav.get_all_tracks_for_queries(
+                query,
+                requester=author,
+                player=player,
+            )
+            if count:
+                if count == 1:
+                    await player.add(requester=author.id, track=successful[0])
+                else:
+                    await player.bulk_add(requester=author.id, tracks_and_queries=successful)
+            single_track = successful[0] if successful else None
         if not (player.is_active or player.queue.empty()):
             await player.next(requester=author)
         file = discord.utils.MISSING
@@ -205,7 +453,7 @@ class PyLavLocalFiles(DISCORD_COG_TYPE_MIXIN):
                 description = _("{track_name_variable_do_not_translate} enqueued.").format(
                     track_name_variable_do_not_translate=await single_track.get_track_display_name(with_url=True)
                 )
-                file = await single_track.get_embedded_artwork()
+                file = await self.get_embedded_artwork(single_track)
                 thumbnail = await single_track.artworkUrl() or discord.utils.MISSING
             case __:
                 description = _("I have enqueued {track_count_variable_do_not_translate} tracks.").format(
@@ -223,37 +471,16 @@ class PyLavLocalFiles(DISCORD_COG_TYPE_MIXIN):
 
     @slash_local.autocomplete("entry")
     async def slash_local_autocomplete_entry(self, interaction: DISCORD_INTERACTION_TYPE, current: str):
-        if not self.pylav.local_tracks_cache.hexdigest_to_query:
+        if not (self.pylav.local_tracks_cache.hexdigest_to_query or self.has_local_index):
             return []
 
-        if not current:
-            extracted = list(islice(self.pylav.local_tracks_cache.hexdigest_to_query.items(), 25))
-        else:
-            current = re.sub(REGEX_FILE_NAME, r" ", current)
-
-            def _filter_partial_ratio(x: tuple[str, Query]):
-                # noinspection PyProtectedMember
-                path = f"{x[1]._query}"
-                # noinspection PyProtectedMember
-                return (
-                    fuzz.partial_ratio(re.sub(REGEX_FILE_NAME, r" ", path), current, score_cutoff=75),
-                    10 if os.path.isdir(path) else 0,
-                    [-ord(i) for i in path],
-                )
-
-            extracted = heapq.nlargest(
-                25, self.pylav.local_tracks_cache.hexdigest_to_query.items(), key=_filter_partial_ratio
-            )
         entries = []
-        for md5, query in extracted:
-            entries.append(
-                Choice(
-                    name=await query.query_to_string(
-                        max_length=90, with_emoji=True, no_extension=True, add_ellipsis=True
-                    ),
-                    value=md5,
-                )
-            )
+        for md5 in await self.search_local_index(interaction.user.id, current):
+            if self._local_index is None or (name := self._local_index.display_name_of(md5)) is None:
+                if (query := await self.resolve_local_entry(md5)) is None:
+                    continue
+                name = await self._display_name(query)
+            entries.append(Choice(name=name, value=md5))
         return entries
 
     @slash_local.error
@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import dataclasses
+import heapq
+import os
+import os.path
+import pickle
+import re
+import threading
+import zlib
+from array import array
+from collections import Counter, defaultdict
+from collections.abc import Iterable, Mapping
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from rapidfuzz import fuzz, process
+
+if TYPE_CHECKING:
+    from pylav.players.query.obj import Query
+
+REGEX_FILE_NAME = re.compile(r"[.\-_/\\ ]+")
+
+NGRAM_SIZE = 3
+MAX_CANDIDATES = 500
+# Most candidates scored for a single input while looking for all of its matches
+MEMO_CANDIDATES = 5000
+SCORE_CUTOFF = 75
+# N-grams shared by more than this fraction of the library (i.e. file extensions) don't narrow anything down
+COMMON_NGRAM_RATIO = 0.5
+SNAPSHOT_VERSION = 2
+
+
+class SearchCancelled(Exception):
+    """Raised inside a search whose result is no longer wanted"""
+
+
+def check_cancelled(cancelled: threading.Event | None) -> None:
+    if cancelled is not None and cancelled.is_set():
+        raise SearchCancelled
+
+
+def normalize(string: str) -> str:
+    """Normalize a path or user input so that both can be compared"""
+    return re.sub(REGEX_FILE_NAME, r" ", string).casefold().strip()
+
+
+def ngrams(string: str, size: int = NGRAM_SIZE) -> set[str]:
+    """Return the set of n-grams in an already normalized string"""
+    return {string[i : i + size] for i in range(len(string) - size + 1)}
+
+
+class LocalTrackIndex:
+    """An n-gram inverted index over the local track cache used to narrow down /local autocomplete"""
+
+    __slots__ = (
+        "hexdigests",
+        "paths",
+        "choices",
+        "is_dir",
+        "display_names",
+        "positions",
+        "postings",
+        "children",
+        "track_counts",
+        "source_size",
+    )
+
+    def __init__(self, entries: Iterable[tuple[str, str]]) -> None:
+        self.hexdigests: list[str] = []
+        self.paths: list[str] = []
+        self.choices: list[str] = []
+        self.is_dir: list[bool] = []
+        postings: defaultdict[str, list[int]] = defaultdict(list)
+        for position, (hexdigest, path) in enumerate(entries):
+            choice = normalize(path)
+            self.hexdigests.append(hexdigest)
+            self.paths.append(path)
+            self.choices.append(choice)
+            self.is_dir.append(os.path.isdir(path))
+            for gram in ngrams(choice):
+                postings[gram].append(position)
+        self.postings: dict[str, array[int]] = {gram: array("I", positions) for gram, positions in postings.items()}
+        self.display_names: list[str | None] = [None] * len(self.hexdigests)
+        self.positions = {hexdigest: position for position, hexdigest in enumerate(self.hexdigests)}
+        self._build_tree()
+        self.source_size = len(self.hexdigests)
+
+    def _build_tree(self) -> None:
+        by_path = {path: position for position, path in enumerate(self.paths)}
+        children: defaultdict[int, list[int]] = defaultdict(list)
+        for position, path in enumerate(self.paths):
+            if (parent := by_path.get(os.path.dirname(path))) is not None:
+                children[parent].append(position)
+        for positions in children.values():
+            positions.sort(key=self.paths.__getitem__)
+        self.children: dict[int, list[int]] = dict(children)
+        self.track_counts: dict[int, int] = {}
+        folders = sorted(
+            (position for position, is_dir in enumerate(self.is_dir) if is_dir),
+            key=lambda position: self.paths[position].count(os.sep),
+            reverse=True,
+        )
+        for folder in folders:
+            self.track_counts[folder] = sum(
+                self.track_counts.get(child, 0) if self.is_dir[child] else 1 for child in self.children.get(folder, ())
+            )
+
+    @classmethod
+    def from_cache(cls, hexdigest_to_query: Mapping[str, Query]) -> LocalTrackIndex:
+        # noinspection PyProtectedMember
+        return cls((hexdigest, f"{query._query}") for hexdigest, query in list(hexdigest_to_query.items()))
+
+    @classmethod
+    def load(cls, file: Path, root: str | None) -> LocalTrackIndex | None:
+        """Load a snapshot written by `dump`, returns None if it is missing, corrupt or for another folder"""
+        try:
+            version, snapshot_root, hexdigests, paths, choices, is_dir, display_names, postings = pickle.loads(
+                zlib.decompress(file.read_bytes())
+            )
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError, TypeError, ValueError):
+            return None
+        if version != SNAPSHOT_VERSION or snapshot_root != root:
+            return None
+        if not len(hexdigests) == len(paths) == len(choices) == len(is_dir) == len(display_names):
+            return None
+        index = cls.__new__(cls)
+        index.hexdigests, index.paths, index.choices, index.is_dir = hexdigests, paths, choices, is_dir
+        index.display_names, index.postings = display_names, postings
+        index.positions = {hexdigest: position for position, hexdigest in enumerate(hexdigests)}
+        index._build_tree()
+        index.source_size = len(hexdigests)
+        return index
+
+    def dump(self, file: Path, root: str | None) -> None:
+        """Write a compressed snapshot of the index so that it can be loaded on the next startup"""
+        data = (
+            SNAPSHOT_VERSION,
+            root,
+            self.hexdigests,
+            self.paths,
+            self.choices,
+            self.is_dir,
+            self.display_names,
+            self.postings,
+        )
+        file.parent.mkdir(parents=True, exist_ok=True)
+        temp = file.with_suffix(".tmp")
+        temp.write_bytes(zlib.compress(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL), 1))
+        os.replace(temp, file)
+
+    def path_of(self, hexdigest: str) -> str | None:
+        return None if (position := self.positions.get(hexdigest)) is None else self.paths[position]
+
+    def display_name_of(self, hexdigest: str) -> str | None:
+        return None if (position := self.positions.get(hexdigest)) is None else self.display_names[position]
+
+    def folder_tracks(self, hexdigest: str, recursive: bool = False) -> list[str] | None:
+        """Return the hexdigests of the tracks inside a folder in path order, or None if the entry is not a folder"""
+        if (position := self.positions.get(hexdigest)) is None or not self.is_dir[position]:
+            return None
+        tracks = []
+        stack = [iter(self.children.get(position, ()))]
+        while stack:
+            if (child := next(stack[-1], None)) is None:
+                stack.pop()
+            elif not self.is_dir[child]:
+                tracks.append(self.hexdigests[child])
+            elif recursive and self.track_counts.get(child):
+                stack.append(iter(self.children.get(child, ())))
+        return tracks
+
+    def reuse_display_names(self, other: LocalTrackIndex) -> None:
+        """Copy the display names already computed by a previous index for the entries both have"""
+        for position, hexdigest in enumerate(self.hexdigests):
+            if (name := other.display_name_of(hexdigest)) is not None:
+                self.display_names[position] = name
+
+    def __len__(self) -> int:
+        return len(self.hexdigests)
+
+    def candidates(self, current: str, limit: int = MEMO_CANDIDATES) -> list[tuple[int, int]]:
+        """Return the (position, shared n-grams) of the entries that can match the normalized input, most shared first
+
+        At most `limit` + 1 entries are returned, so that callers can tell whether any were left out.
+        """
+        if len(current) < NGRAM_SIZE:
+            matches = (position for position, choice in enumerate(self.choices) if current in choice)
+            return [(position, 1) for position, __ in zip(matches, range(limit + 1))]
+        grams = sorted(
+            (self.postings[gram] for gram in ngrams(current) if gram in self.postings),
+            key=len,
+        )
+        if not grams:
+            return []
+        threshold = len(self) * COMMON_NGRAM_RATIO
+        if selective := [posting for posting in grams if len(posting) <= threshold]:
+            grams = selective
+        counter = Counter()
+        for posting in grams:
+            counter.update(posting)
+        return counter.most_common(limit + 1)
+
+    def _score(self, current: str, positions: list[int]) -> list[tuple[int, float, int]]:
+        """Return the (position, score, offset in `positions`) of the given entries passing the score cutoff"""
+        extracted = process.extract(
+            current,
+            [self.choices[position] for position in positions],
+            scorer=fuzz.partial_ratio,
+            limit=None,
+            score_cutoff=SCORE_CUTOFF,
+        )
+        return [(positions[offset], score, offset) for __, score, offset in extracted]
+
+    def search(
+        self,
+        current: str,
+        limit: int = 25,
+        memo: SearchMemo | None = None,
+        cancelled: threading.Event | None = None,
+    ) -> tuple[list[str], SearchMemo | None]:
+        """Return the hexdigests of the best matches for the user input
+
+        If `memo` holds the matches of a prefix of the input, only those are scored again.
+        Raises SearchCancelled between stages once `cancelled` is set.
+        """
+        current = normalize(current)
+        if not current:
+            return self.hexdigests[:limit], None
+        if memo is not None and memo.covers(self, current):
+            check_cancelled(cancelled)
+            matches, complete = self._score(current, memo.positions), True
+        else:
+            # Candidates are scored in batches, most shared n-grams first. Once every match found so far shares more
+            # n-grams than the next candidate, the rest are assumed not to match and the matches are complete, so
+            # the next keystroke only has to score them again.
+            ranked = self.candidates(current)
+            matches, scored = [], 0
+            least_shared = len(current)
+            while True:
+                check_cancelled(cancelled)
+                batch = ranked[scored : scored + MAX_CANDIDATES]
+                if found := self._score(current, [position for position, __ in batch]):
+                    matches.extend(found)
+                    least_shared = batch[max(offset for *__, offset in found)][1]
+                scored += len(batch)
+                complete = scored == len(ranked) or least_shared > ranked[scored][1]
+                if complete or scored >= MEMO_CANDIDATES:
+                    break
+        check_cancelled(cancelled)
+        best = heapq.nsmallest(
+            limit,
+            ((-score, not self.is_dir[position], self.paths[position], position) for position, score, __ in matches),
+        )
+        return [self.hexdigests[position] for *__, position in best], SearchMemo(
+            self, current, [position for position, *__ in matches], complete
+        )
+
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class SearchMemo:
+    """The matches of a previous search, reused while the user keeps typing the same query"""
+
+    index: LocalTrackIndex
+    current: str
+    positions: list[int]
+    complete: bool
+
+    def covers(self, index: LocalTrackIndex, current: str) -> bool:
+        return self.complete and self.index is index and current.startswith(self.current)
@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from collections.abc import Iterable, Mapping
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from redbot.core.utils.dbtools import APSWConnectionWrapper
+
+from pylav.logging import getLogger
+
+from pllocal.index import normalize
+
+try:
+    import mutagen
+except ImportError:
+    mutagen = None
+
+LOGGER = getLogger("PyLav.cog.LocalFiles.Metadata")
+
+BATCH_SIZE = 256
+METADATA_WORKERS = min(os.cpu_count() or 1, 4)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    hexdigest TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    mtime INTEGER NOT NULL,
+    title TEXT,
+    artist TEXT,
+    album TEXT,
+    duration REAL,
+    codec TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS metadata_fts USING fts5(hexdigest UNINDEXED, title, artist, album);
+"""
+
+MetadataRow = tuple[str, str, int, str | None, str | None, str | None, float | None, str | None]
+
+
+def _first_tag(tags: Mapping | None, key: str) -> str | None:
+    if not tags or not (value := tags.get(key)):
+        return None
+    return str(value[0] if isinstance(value, list) else value)
+
+
+def read_metadata(batch: list[tuple[str, str]]) -> list[MetadataRow]:
+    """Read the tags, duration and codec of a batch of (hexdigest, path) pairs, runs in a worker process"""
+    rows = []
+    for hexdigest, path in batch:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            audio = mutagen.File(path, easy=True)
+        except Exception:
+            continue
+        if audio is None:
+            continue
+        info = getattr(audio, "info", None)
+        rows.append(
+            (
+                hexdigest,
+                path,
+                mtime,
+                _first_tag(audio.tags, "title"),
+                _first_tag(audio.tags, "artist"),
+                _first_tag(audio.tags, "album"),
+                getattr(info, "length", None),
+                (audio.mime[0] if audio.mime else type(audio).__name__),
+            )
+        )
+    return rows
+
+
+class LocalMetadataIndex:
+    """A SQLite full-text index of the tags of the local tracks, keyed by the local track cache hexdigests"""
+
+    def __init__(self, file: Path) -> None:
+        self.file = file
+        self._connection: APSWConnectionWrapper | None = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def available(self) -> bool:
+        return mutagen is not None
+
+    @property
+    def connection(self) -> APSWConnectionWrapper:
+        if self._connection is None:
+            self.file.parent.mkdir(parents=True, exist_ok=True)
+            connection = APSWConnectionWrapper(str(self.file))
+            connection.cursor().execute(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _stale(self, entries: Mapping[str, str]) -> tuple[list[tuple[str, str]], list[str]]:
+        known = {
+            hexdigest: mtime
+            for hexdigest, mtime in self.connection.cursor().execute("SELECT hexdigest, mtime FROM metadata")
+        }
+        missing = []
+        for hexdigest, path in entries.items():
+            try:
+                if known.get(hexdigest) == os.stat(path).st_mtime_ns or os.path.isdir(path):
+                    continue
+            except OSError:
+                continue
+            missing.append((hexdigest, path))
+        return missing, [hexdigest for hexdigest in known if hexdigest not in entries]
+
+    def _write(self, rows: Iterable[MetadataRow], removed: Iterable[str] = ()) -> None:
+        removed = [(hexdigest,) for hexdigest in removed]
+        rows = list(rows)
+        with self.connection:
+            cursor = self.connection.cursor()
+            cursor.executemany("DELETE FROM metadata WHERE hexdigest = ?", removed)
+            cursor.executemany("DELETE FROM metadata_fts WHERE hexdigest = ?", removed)
+            cursor.executemany("DELETE FROM metadata_fts WHERE hexdigest = ?", [(row[0],) for row in rows])
+            cursor.executemany("INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            cursor.executemany(
+                "INSERT INTO metadata_fts (hexdigest, title, artist, album) VALUES (?, ?, ?, ?)",
+                [(row[0], row[3], row[4], row[5]) for row in rows],
+            )
+
+    async def update(self, entries: Mapping[str, str]) -> None:
+        """Extract the metadata of every new or modified entry in a process pool"""
+        if not self.available:
+            return
+        async with self._lock:
+            missing, removed = await asyncio.to_thread(self._stale, entries)
+            await asyncio.to_thread(self._write, (), removed)
+            if not missing:
+                return
+            LOGGER.debug("Extracting metadata for %s local tracks", len(missing))
+            loop = asyncio.get_running_loop()
+            iterator = iter(missing)
+            writing = asyncio.Lock()
+
+            async def extract() -> None:
+                # Each worker keeps a single batch in the pool, so batches are only built as the pool frees up
+                while batch := list(islice(iterator, BATCH_SIZE)):
+                    try:
+                        rows = await loop.run_in_executor(executor, read_metadata, batch)
+                    except Exception as exc:
+                        LOGGER.warning("Failed to extract local track metadata", exc_info=exc)
+                        continue
+                    async with writing:
+                        await asyncio.to_thread(self._write, rows)
+
+            executor = ProcessPoolExecutor(max_workers=METADATA_WORKERS)
+            try:
+                await asyncio.gather(*(extract() for __ in range(METADATA_WORKERS)))
+            finally:
+                # Don't block the event loop on the workers when the update is cancelled or fails
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def search(self, current: str, limit: int = 25) -> list[str]:
+        """Return the hexdigests whose tags match every word of the user input, best match first"""
+        if self._connection is None or not (tokens := normalize(current).split()):
+            return []
+        match = " ".join('"{}"*'.format(token.replace('"', '""')) for token in tokens)
+        return [
+            hexdigest
+            for (hexdigest,) in self._connection.cursor().execute(
+                "SELECT hexdigest FROM metadata_fts WHERE metadata_fts MATCH ? ORDER BY rank LIMIT ?", (match, limit)
+            )
+        ]
+
+
+def merge_rankings(path_matches: list[str], tag_matches: list[str], limit: int = 25) -> list[str]:
+    """Rank entries matching on both path and tags first, then alternate between path and tag matches"""
+    tagged = set(tag_matches)
+    both = [hexdigest for hexdigest in path_matches if hexdigest in tagged]
+    seen = set(both)
+    path_only = [hexdigest for hexdigest in path_matches if hexdigest not in seen]
+    tag_only = [hexdigest for hexdigest in tag_matches if hexdigest not in seen]
+    merged = both
+    for pair in zip(path_only, tag_only):
+        merged.extend(pair)
+    shortest = min(len(path_only), len(tag_only))
+    merged.extend(path_only[shortest:] or tag_only[shortest:])
+    return merged[:limit]
@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import hashlib
+import os
+from collections.abc import Awaitable, Callable, Iterable
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from pylav.compat import json
+from pylav.logging import getLogger
+from pylav.players.query.obj import Query
+
+if TYPE_CHECKING:
+    from pylav.core.client import Client
+    from pylav.type_hints.bot import DISCORD_BOT_TYPE
+
+try:
+    from watchfiles import awatch
+except ImportError:
+    awatch = None
+
+LOGGER = getLogger("PyLav.cog.LocalFiles.Refresh")
+
+AUDIO_EXTENSIONS = frozenset(
+    {
+        ".aac",
+        ".aiff",
+        ".alac",
+        ".flac",
+        ".flv",
+        ".m3u",
+        ".m3u8",
+        ".m4a",
+        ".mka",
+        ".mkv",
+        ".mov",
+        ".mp3",
+        ".mp4",
+        ".oga",
+        ".ogg",
+        ".opus",
+        ".pls",
+        ".wav",
+        ".webm",
+        ".wma",
+    }
+)
+MANIFEST_VERSION = 1
+
+
+def local_hexdigest(path: str) -> str:
+    return hashlib.md5(path.encode()).hexdigest()
+
+
+@dataclasses.dataclass(slots=True)
+class DirectoryEntry:
+    mtime: int
+    dirs: list[str]
+    files: list[str]
+
+
+@dataclasses.dataclass(slots=True)
+class LocalTracksDelta:
+    added: list[str] = dataclasses.field(default_factory=list)
+    removed: list[str] = dataclasses.field(default_factory=list)
+    rescanned: int = 0
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed)
+
+
+class LocalTracksManifest:
+    """A persisted snapshot of the local tracks folder used to find what changed since the last refresh"""
+
+    def __init__(self, file: Path, root: str | None = None) -> None:
+        self.file = file
+        self.root = root
+        self.directories: dict[str, DirectoryEntry] = {}
+
+    def load(self) -> bool:
+        try:
+            with self.file.open("rb") as fp:
+                data = json.loads(fp.read())
+        except (OSError, ValueError):
+            return False
+        if data.get("version") != MANIFEST_VERSION or data.get("root") != self.root:
+            return False
+        self.directories = {path: DirectoryEntry(**entry) for path, entry in data["directories"].items()}
+        return True
+
+    def save(self) -> None:
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "version": MANIFEST_VERSION,
+            "root": self.root,
+            "directories": {path: dataclasses.asdict(entry) for path, entry in self.directories.items()},
+        }
+        temp = self.file.with_suffix(".tmp")
+        with temp.open("w", encoding="utf-8") as fp:
+            fp.write(json.dumps(data))
+        os.replace(temp, self.file)
+
+    @staticmethod
+    def _list_directory(path: str, extensions: frozenset[str]) -> DirectoryEntry | None:
+        dirs, files = [], []
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            with os.scandir(path) as iterator:
+                for entry in iterator:
+                    if entry.is_dir(follow_symlinks=True):
+                        dirs.append(entry.path)
+                    elif os.path.splitext(entry.name)[1].lower() in extensions:
+                        files.append(entry.path)
+        except OSError:
+            return None
+        return DirectoryEntry(mtime=mtime, dirs=sorted(dirs), files=sorted(files))
+
+    def _drop(self, path: str, delta: LocalTracksDelta) -> None:
+        if (entry := self.directories.pop(path, None)) is None:
+            return
+        delta.removed.extend(entry.files)
+        for child in entry.dirs:
+            delta.removed.append(child)
+            self._drop(child, delta)
+
+    def refresh(self, extensions: frozenset[str], dirty: Iterable[str] | None = None) -> LocalTracksDelta:
+        """Walk the tree, relisting only the directories whose mtime changed (or the given dirty ones)"""
+        delta = LocalTracksDelta()
+        dirty = set(dirty or ())
+        stack = [self.root]
+        while stack:
+            path = stack.pop()
+            old = self.directories.get(path)
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                self._drop(path, delta)
+                continue
+            if old is not None and old.mtime == mtime and path not in dirty:
+                stack.extend(old.dirs)
+                continue
+            if (new := self._list_directory(path, extensions)) is None:
+                self._drop(path, delta)
+                continue
+            delta.rescanned += 1
+            old_dirs, old_files = (set(old.dirs), set(old.files)) if old else (set(), set())
+            delta.added.extend(set(new.files).difference(old_files))
+            delta.removed.extend(old_files.difference(new.files))
+            delta.added.extend(set(new.dirs).difference(old_dirs))
+            for removed in old_dirs.difference(new.dirs):
+                delta.removed.append(removed)
+                self._drop(removed, delta)
+            self.directories[path] = new
+            stack.extend(new.dirs)
+        return delta
+
+
+class LocalTracksRefresher:
+    """Applies incremental changes of the local tracks folder to PyLav's local track cache"""
+
+    def __init__(self, bot: DISCORD_BOT_TYPE, manifest_file: Path) -> None:
+        self.bot = bot
+        self.manifest_file = manifest_file
+        self.manifest: LocalTracksManifest | None = None
+        self._lock = asyncio.Lock()
+        self._watcher: asyncio.Task[None] | None = None
+        self._stop_watching = asyncio.Event()
+
+    @property
+    def client(self) -> Client:
+        return self.bot.pylav
+
+    @property
+    def is_watching(self) -> bool:
+        return self._watcher is not None and not self._watcher.done()
+
+    async def root_folder(self) -> str | None:
+        if folder := await self.client.lib_db_manager.get_config().fetch_localtrack_folder():
+            return os.path.realpath(folder)
+        return None
+
+    async def _load_manifest(self, root: str) -> tuple[LocalTracksManifest, bool]:
+        if self.manifest is not None and self.manifest.root == root:
+            return self.manifest, True
+        manifest = LocalTracksManifest(self.manifest_file, root)
+        loaded = await asyncio.to_thread(manifest.load)
+        return manifest, loaded
+
+    async def _record(self) -> None:
+        if (root := await self.root_folder()) is None:
+            return
+        manifest = LocalTracksManifest(self.manifest_file, root)
+        await asyncio.to_thread(manifest.refresh, AUDIO_EXTENSIONS)
+        await asyncio.to_thread(manifest.save)
+        self.manifest = manifest
+
+    async def record(self) -> None:
+        """Record a fresh manifest of the local tracks folder without touching the cache"""
+        async with self._lock:
+            await self._record()
+
+    async def rebuild(self) -> None:
+        """Rebuild PyLav's local track cache from scratch and record a fresh manifest"""
+        async with self._lock:
+            await self.client.local_tracks_cache.update()
+            await self._record()
+
+    async def refresh(self, dirty: Iterable[str] | None = None) -> LocalTracksDelta | None:
+        """Rescan the changed subtrees and apply the delta to the cache.
+
+        Returns None if there is no usable manifest yet, in which case a full rebuild is needed.
+        """
+        async with self._lock:
+            if (root := await self.root_folder()) is None:
+                return None
+            manifest, loaded = await self._load_manifest(root)
+            if not loaded:
+                return None
+            delta = await asyncio.to_thread(manifest.refresh, AUDIO_EXTENSIONS, dirty)
+            if delta:
+                await self._apply(delta)
+            await asyncio.to_thread(manifest.save)
+            self.manifest = manifest
+            LOGGER.debug(
+                "Refreshed local tracks: %s added, %s removed, %s directories rescanned",
+                len(delta.added),
+                len(delta.removed),
+                delta.rescanned,
+            )
+            return delta
+
+    async def _apply(self, delta: LocalTracksDelta) -> None:
+        cache = self.client.local_tracks_cache
+        # noinspection PyProtectedMember
+        path_to_hexdigest = {f"{query._query}": hexdigest for hexdigest, query in cache.hexdigest_to_query.items()}
+        for path in delta.removed:
+            cache.path_to_track.pop(path, None)
+            if (hexdigest := path_to_hexdigest.get(path)) is not None:
+                cache.hexdigest_to_query.pop(hexdigest, None)
+        for path in delta.added:
+            if path in path_to_hexdigest:
+                continue
+            try:
+                query = await Query.from_string(path)
+            except Exception as exc:
+                LOGGER.debug("Failed to load local track %s", path, exc_info=exc)
+                continue
+            cache.path_to_track[path] = query
+            cache.hexdigest_to_query[local_hexdigest(path)] = query
+
+    def start_watching(self, on_change: Callable[[], Awaitable[None]] | None = None) -> bool:
+        """Start applying changes as the filesystem reports them, returns False if watchfiles is unavailable"""
+        if awatch is None:
+            return False
+        if not self.is_watching:
+            self._stop_watching.clear()
+            self._watcher = asyncio.create_task(self._watch(on_change))
+        return True
+
+    async def stop_watching(self) -> None:
+        if self._watcher is None:
+            return
+        self._stop_watching.set()
+        self._watcher.cancel()
+        try:
+            await self._watcher
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._watcher = None
+
+    async def _watch(self, on_change: Callable[[], Awaitable[None]] | None = None) -> None:
+        if (root := await self.root_folder()) is None:
+            return
+        if await self.refresh() is None:
+            await self.record()
+        async for changes in awatch(root, stop_event=self._stop_watching, debounce=2000, recursive=True):
+            dirty = {os.path.dirname(path) for __, path in changes}
+            try:
+                delta = await self.refresh(dirty)
+            except Exception as exc:
+                LOGGER.warning("Failed to apply local track changes", exc_info=exc)
+                continue
+            if delta and on_change is not None:
+                await on_change()
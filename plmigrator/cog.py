@@ -1,10 +1,18 @@
 from __future__ import annotations
 
 import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import datetime
+import itertools
+import operator
+import time
 import typing
 from pathlib import Path
 
 import aiopath
+import discord
 from redbot.cogs.audio.apis.api_utils import PlaylistFetchResult
 from redbot.cogs.audio.apis.playlist_wrapper import PlaylistWrapper
 from redbot.cogs.audio.utils import (
@@ -16,6 +24,7 @@ from redbot.cogs.audio.utils import (
 from redbot.core import Config, commands
 from redbot.core.data_manager import cog_data_path
 from redbot.core.i18n import Translator, cog_i18n
+from redbot.core.utils.chat_formatting import humanize_timedelta
 from redbot.core.utils.dbtools import APSWConnectionWrapper
 
 from pylav.constants.config import DEFAULT_PLAYER_VOLUME
@@ -23,13 +32,31 @@ from pylav.core.client import Client
 from pylav.core.context import PyLavContext
 from pylav.extension.red.utils import recursive_merge
 from pylav.logging import getLogger
+from pylav.nodes.api.responses.track import Track as Track_namespace_conflict
 from pylav.players.query.obj import Query
 from pylav.type_hints.bot import DISCORD_BOT_TYPE, DISCORD_COG_TYPE_MIXIN
 
+try:
+    # The Playlists cog owns the local track decoder, without it tracks are decoded through PyLav one at a time
+    from plplaylists.importer import decode_blobs, decode_track
+except ImportError:
+    decode_blobs = decode_track = None
+
 LOGGER = getLogger("PyLav.cog.Migrator")
 
 _ = Translator("PyLavMigrator", Path(__file__))
 
+# Number of playlists migrated at the same time
+MIGRATION_CONCURRENCY = 8
+# Number of concurrent requests per source, sources backed by rate limited APIs get fewer
+SOURCE_CONCURRENCY = 4
+SOURCE_CONCURRENCY_OVERRIDES = {"Spotify": 2, "Apple Music": 2, "Deezer": 2}
+# Seconds between edits of the progress message
+MIGRATION_PROGRESS_INTERVAL = 5.0
+# Playlists with at least this many stored tracks are decoded in a process pool, in chunks of DECODE_CHUNK
+DECODE_PROCESS_THRESHOLD = 2000
+DECODE_CHUNK = 500
+
 
 @cog_i18n(_)
 class PyLavMigrator(DISCORD_COG_TYPE_MIXIN):
@@ -42,6 +69,7 @@ class PyLavMigrator(DISCORD_COG_TYPE_MIXIN):
     def __init__(self, bot: DISCORD_BOT_TYPE, *args: typing.Any, **kwargs: typing.Any) -> None:
         super().__init__(*args, **kwargs)
         self.bot = bot
+        self._playlists_config: Config | None = None
 
     @commands.is_owner()
     @commands.command(name="plmigrate")
@@ -132,60 +160,181 @@ class PyLavMigrator(DISCORD_COG_TYPE_MIXIN):
                         deleted = false
                 """
         row_results = await asyncio.to_thread(playlist_api.database.cursor().execute, query)
-        for row in row_results:
-            pl = PlaylistFetchResult(*row)
-            queries = [await Query.from_string(track["info"]["uri"]) for track in pl.tracks if track.get("info")]
-            url = pl.playlist_url
-            try:
-                if pl.playlist_id == 42069:
-                    continue
-                if url:
-                    response = await self.pylav.get_tracks(await Query.from_string(url))
-                    match response.loadType:
-                        case "track":
-                            tracks = [response.data]
-                        case "search":
-                            tracks = response.data
-                        case "playlist":
-                            tracks = response.data.tracks
-                        case __:
-                            LOGGER.error(
-                                "Failed to fetch v4+ tracks playlist %s (%s) from scope: %s",
-                                pl.playlist_name,
-                                pl.playlist_id,
-                                pl.scope_id,
-                            )
-                            continue
-                else:
-                    tracks, __, __ = await self.bot.pylav.get_all_tracks_for_queries(
-                        *queries, requester=context.guild.me
-                    )
+        playlists = [PlaylistFetchResult(*row) for row in row_results]
+        playlists = [pl for pl in playlists if pl.playlist_id != 42069]
+        semaphore = asyncio.Semaphore(MIGRATION_CONCURRENCY)
+        limits: collections.defaultdict[str, asyncio.Semaphore] = collections.defaultdict(
+            lambda: asyncio.Semaphore(SOURCE_CONCURRENCY)
+        )
+        for source, limit in SOURCE_CONCURRENCY_OVERRIDES.items():
+            limits[source] = asyncio.Semaphore(limit)
+        done = failed = 0
+        started = last_update = time.monotonic()
+        message = await context.send(
+            content=_("Migrating {total_variable_do_not_translate} playlists...").format(
+                total_variable_do_not_translate=len(playlists)
+            ),
+            ephemeral=True,
+        )
 
-                if tracks:
-                    await self.pylav.playlist_db_manager.create_or_update_playlist(
-                        identifier=pl.playlist_id,
-                        name=pl.playlist_name,
-                        scope=pl.scope_id,
-                        author=pl.author_id,
-                        url=pl.playlist_url,
-                        tracks=tracks,
-                    )
-                    LOGGER.info(
-                        "Successfully migrated playlist %s (%s) from guild: %s in scope: %s",
-                        pl.playlist_name,
-                        pl.playlist_id,
-                        pl.author_id,
-                        pl.scope_id,
+        async def report(final: bool = False) -> None:
+            nonlocal last_update
+            if message is None or (not final and time.monotonic() - last_update < MIGRATION_PROGRESS_INTERVAL):
+                return
+            last_update = time.monotonic()
+            remaining = (last_update - started) / done * (len(playlists) - done) if done else 0
+            with contextlib.suppress(discord.HTTPException):
+                await message.edit(
+                    content=_(
+                        "Migrated {done_variable_do_not_translate}/{total_variable_do_not_translate} playlists, "
+                        "{failed_variable_do_not_translate} failed. Time remaining: {eta_variable_do_not_translate}."
+                    ).format(
+                        done_variable_do_not_translate=done,
+                        total_variable_do_not_translate=len(playlists),
+                        failed_variable_do_not_translate=failed,
+                        eta_variable_do_not_translate=humanize_timedelta(
+                            timedelta=datetime.timedelta(seconds=max(remaining, 1))
+                        ),
                     )
-            except Exception as exc:
-                LOGGER.error(
-                    "Failed to migrate playlist %s (%s) from guild: %s in scope: %s",
+                )
+
+        async def migrate(pl: PlaylistFetchResult) -> None:
+            nonlocal done, failed
+            async with semaphore:
+                if not await self._migrate_playlist(pl, context, limits, pool):
+                    failed += 1
+            done += 1
+            await report()
+
+        pool = None
+        if decode_track is not None and any(len(pl.tracks) >= DECODE_PROCESS_THRESHOLD for pl in playlists):
+            pool = concurrent.futures.ProcessPoolExecutor()
+        try:
+            await asyncio.gather(*(migrate(pl) for pl in playlists))
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        await report(final=True)
+
+    async def _migrate_playlist(
+        self,
+        pl: PlaylistFetchResult,
+        context: PyLavContext,
+        limits: collections.defaultdict[str, asyncio.Semaphore],
+        pool: concurrent.futures.ProcessPoolExecutor | None = None,
+    ) -> bool:
+        """Migrate a single Audio playlist, returning whether it succeeded"""
+        url = pl.playlist_url
+        entries = [track for track in pl.tracks if track.get("info") or track.get("track")]
+        try:
+            decoded = await self._decode_stored_tracks([track.get("track") for track in entries], pool)
+            if url and entries and all(decoded):
+                # The stored snapshot is complete, the URL is kept so the playlist can be refreshed later
+                tracks = decoded
+            elif url:
+                query = await Query.from_string(url)
+                async with limits[query.source]:
+                    response = await self.pylav.get_tracks(query)
+                match response.loadType:
+                    case "track":
+                        tracks = [response.data]
+                    case "search":
+                        tracks = response.data
+                    case "playlist":
+                        tracks = response.data.tracks
+                    case __:
+                        LOGGER.error(
+                            "Failed to fetch v4+ tracks playlist %s (%s) from scope: %s",
+                            pl.playlist_name,
+                            pl.playlist_id,
+                            pl.scope_id,
+                        )
+                        return False
+            else:
+                # Only the tracks whose stored blob could not be decoded are resolved through a node
+                tracks = []
+                queries = []
+                for entry, track in zip(entries, decoded):
+                    if track is not None:
+                        tracks.extend(await self._resolve_queries(queries, context, limits))
+                        queries = []
+                        tracks.append(track)
+                    elif uri := (entry.get("info") or {}).get("uri"):
+                        queries.append(await Query.from_string(uri))
+                tracks.extend(await self._resolve_queries(queries, context, limits))
+
+            if tracks:
+                await self.pylav.playlist_db_manager.create_or_update_playlist(
+                    identifier=pl.playlist_id,
+                    name=pl.playlist_name,
+                    scope=pl.scope_id,
+                    author=pl.author_id,
+                    url=pl.playlist_url,
+                    tracks=tracks,
+                )
+                await self._invalidate_playlist(pl.playlist_id)
+                LOGGER.info(
+                    "Successfully migrated playlist %s (%s) from guild: %s in scope: %s",
                     pl.playlist_name,
                     pl.playlist_id,
                     pl.author_id,
                     pl.scope_id,
-                    exc_info=exc,
                 )
+            return True
+        except Exception as exc:
+            LOGGER.error(
+                "Failed to migrate playlist %s (%s) from guild: %s in scope: %s",
+                pl.playlist_name,
+                pl.playlist_id,
+                pl.author_id,
+                pl.scope_id,
+                exc_info=exc,
+            )
+            return False
+
+    async def _invalidate_playlist(self, playlist_id: int) -> None:
+        """Drop the stats and cached tracks PyLavPlaylists keeps for a playlist that was overwritten"""
+        if (cog := self.bot.get_cog("PyLavPlaylists")) is not None:
+            await cog.invalidate_playlist(playlist_id)
+            return
+        if self._playlists_config is None:
+            self._playlists_config = Config.get_conf(None, identifier=208903205982044161, cog_name="PyLavPlaylists")
+            self._playlists_config.init_custom("PLAYLIST_STATS", 1)
+        await self._playlists_config.custom("PLAYLIST_STATS", playlist_id).clear()
+
+    async def _decode_stored_tracks(
+        self, blobs: list[str | None], pool: concurrent.futures.ProcessPoolExecutor | None
+    ) -> list[Track_namespace_conflict | None]:
+        """Decode stored track blobs locally, large playlists are split across the process pool"""
+        if decode_track is None:
+            decoded = []
+            for blob in blobs:
+                try:
+                    decoded.append(await self.pylav.decode_track(blob, raise_on_failure=True) if blob else None)
+                except Exception:
+                    decoded.append(None)
+            return decoded
+        if pool is None or len(blobs) < DECODE_PROCESS_THRESHOLD:
+            return await asyncio.to_thread(decode_blobs, blobs)
+        loop = asyncio.get_running_loop()
+        chunks = await asyncio.gather(
+            *(
+                loop.run_in_executor(pool, decode_blobs, blobs[start : start + DECODE_CHUNK])
+                for start in range(0, len(blobs), DECODE_CHUNK)
+            )
+        )
+        return list(itertools.chain.from_iterable(chunks))
+
+    async def _resolve_queries(
+        self, queries: list[Query], context: PyLavContext, limits: collections.defaultdict[str, asyncio.Semaphore]
+    ) -> list[Track_namespace_conflict]:
+        tracks = []
+        # Runs of tracks from the same source are resolved together, in order, within that source's limit
+        for source, run in itertools.groupby(queries, key=operator.attrgetter("source")):
+            async with limits[source]:
+                loaded, __, __ = await self.bot.pylav.get_all_tracks_for_queries(*run, requester=context.guild.me)
+            tracks.extend(loaded)
+        return tracks
 
     async def _process_server_settings(self, guild: int, guild_config: typing.MutableMapping[str, typing.Any]) -> None:
         player_config = self.pylav.player_config_manager.get_config(guild)
@@ -1,44 +1,86 @@
 from __future__ import annotations
 
+import asyncio
 import collections
 import contextlib
+import datetime
 import itertools
-import json
+import random
+import time
 import typing
+from collections.abc import Iterable
 from pathlib import Path
 from typing import Literal
 
 import discord
+from apscheduler.jobstores.base import JobLookupError
 from dacite import from_dict
 from discord import app_commands
 from redbot.core import Config, commands
 from redbot.core.i18n import Translator, cog_i18n
-from redbot.core.utils.chat_formatting import bold, box, humanize_list
+from redbot.core.utils.chat_formatting import bold, box, humanize_list, humanize_timedelta
 from tabulate import tabulate
 
 from pylav.constants.playlists import BUNDLED_PLAYLIST_IDS
 from pylav.core.client import Client
 from pylav.core.context import PyLavContext
+from pylav.events.player import PlayerDisconnectedEvent, PlayerStoppedEvent
+from pylav.events.queue import QueueEndEvent, QueueShuffledEvent, QueueTracksRemovedEvent
+from pylav.events.track import TrackSkippedEvent
+from pylav.events.track.track_start import TrackStartEvent
 from pylav.exceptions.client import PyLavInvalidArgumentsException
 from pylav.exceptions.playlist import InvalidPlaylistException
 from pylav.extension.red.ui.menus.generic import PaginatingMenu
 from pylav.extension.red.ui.menus.playlist import PlaylistCreationFlow, PlaylistManageFlow
 from pylav.extension.red.ui.prompts.playlists import maybe_prompt_for_playlist
-from pylav.extension.red.ui.sources.playlist import PlaylistListSource, TrackMappingSource
+from pylav.extension.red.ui.sources.playlist import PlaylistListSource
 from pylav.extension.red.utils import CompositeMetaClass, rgetattr
 from pylav.extension.red.utils.decorators import always_hidden, invoker_is_dj, requires_player
 from pylav.helpers.discord.converters.playlists import PlaylistConverter
 from pylav.helpers.discord.converters.queries import QueryPlaylistConverter
 from pylav.helpers.format.ascii import EightBitANSI
 from pylav.helpers.format.strings import shorten_string
+from pylav.helpers.time import get_now_utc
+from pylav.logging import getLogger
 from pylav.nodes.api.responses.track import Track as Track_namespace_conflict
+from pylav.players.player import Player
 from pylav.players.query.obj import Query
 from pylav.players.tracks.obj import Track
 from pylav.storage.models.playlist import Playlist
 from pylav.type_hints.bot import DISCORD_BOT_TYPE, DISCORD_COG_TYPE_MIXIN, DISCORD_INTERACTION_TYPE
 
+from plplaylists.importer import PlaylistImporter
+from plplaylists.mixes import MixCache
+from plplaylists.names import IndexedPlaylistConverter, PlaylistNameIndex
+from plplaylists.sources import PagedTrackMappingSource
+from plplaylists.stats import PLAYLIST_STATS, PlaylistStats
+from plplaylists.store import SharedTrackStore
+from plplaylists.tracks import (
+    TrackDiff,
+    dedupe_tracks,
+    diff_tracks,
+    difference_references,
+    intersect_references,
+    remove_tracks,
+    track_title,
+    union_references,
+)
+from plplaylists.window import LAZY_ENQUEUE_THRESHOLD, WINDOW_SIZE, PlaylistWindow
+
 _ = Translator("PyLavPlaylists", Path(__file__))
 
+LOGGER = getLogger("PyLav.cog.Playlists")
+
+PLAYLIST_ENQUEUE_CHUNK = 100
+PLAYLIST_BUILD_CONCURRENCY = 10
+REFRESH_CONCURRENCY = 4
+QUEUE_SAVE_CHUNK = 500
+# Seconds, both the scheduled refresh and each playlist within it are delayed by up to this much
+REFRESH_JITTER = 300
+IMPORT_PROGRESS_INTERVAL = 2.0
+# Minutes, the name index is rebuilt this often to pick up playlists created or renamed outside this cog
+NAME_INDEX_REBUILD_INTERVAL = 30
+
 
 @cog_i18n(_)
 class PyLavPlaylists(
@@ -61,6 +103,38 @@ class PyLavPlaylists(
         super().__init__(*args, **kwargs)
         self.bot = bot
         self._config = Config.get_conf(self, identifier=208903205982044161)
+        self._config.register_global(refresh_interval=0)
+        self._config.init_custom(PLAYLIST_STATS, 1)
+        self._config.register_custom(PLAYLIST_STATS, stats=None)
+        # Windows are consumed in the order their playlists were played
+        self._windows: collections.defaultdict[int, collections.deque[PlaylistWindow]] = collections.defaultdict(
+            collections.deque
+        )
+        self._track_store = SharedTrackStore()
+        self.name_index = PlaylistNameIndex()
+        self._mix_cache = MixCache(self._resolve_mix)
+        self._window_locks: collections.defaultdict[int, asyncio.Lock] = collections.defaultdict(asyncio.Lock)
+
+    async def initialize(self, *args, **kwargs) -> None:
+        self._schedule_refresh(await self._config.refresh_interval())
+        self.pylav.scheduler.add_job(
+            self.rebuild_name_index,
+            trigger="interval",
+            minutes=NAME_INDEX_REBUILD_INTERVAL,
+            max_instances=1,
+            id=f"{self.__class__.__name__}-{self.bot.user.id}-rebuild_name_index",
+            replace_existing=True,
+            coalesce=True,
+            next_run_time=get_now_utc() + datetime.timedelta(seconds=5),
+        )
+
+    async def cog_unload(self) -> None:
+        self._schedule_refresh(0)
+        with contextlib.suppress(JobLookupError):
+            self.pylav.scheduler.remove_job(f"{self.__class__.__name__}-{self.bot.user.id}-rebuild_name_index")
+        self._track_store.clear()
+        self.name_index.clear()
+        self._mix_cache.clear()
 
     async def red_delete_data_for_user(
         self,
@@ -73,6 +147,31 @@ class PyLavPlaylists(
         """
         await self._config.user_from_id(user_id).clear()
 
+    @commands.group(name="playlistset")
+    async def command_playlistset(self, context: PyLavContext) -> None:
+        """Configure cog settings"""
+
+    @command_playlistset.command(name="refresh")
+    @commands.is_owner()
+    async def command_playlistset_refresh(self, context: PyLavContext, hours: commands.Range[int, 0, 720]) -> None:
+        """Refresh every playlist linked to a URL every few hours in the background, 0 to disable"""
+        if isinstance(context, discord.Interaction):
+            context = await self.bot.get_context(context)
+        if context.interaction and not context.interaction.response.is_done():
+            await context.defer(ephemeral=True)
+        await self._config.refresh_interval.set(hours)
+        self._schedule_refresh(hours)
+        if hours:
+            description = _(
+                "I will refresh the playlists linked to a URL every {hours_variable_do_not_translate} hours."
+            ).format(hours_variable_do_not_translate=hours)
+        else:
+            description = _("I will no longer refresh the playlists linked to a URL in the background.")
+        await context.send(
+            embed=await context.pylav.construct_embed(description=description, messageable=context),
+            ephemeral=True,
+        )
+
     @slash_playlist.command(name="version")
     @app_commands.guild_only()
     async def slash_playlist_version(self, interaction: DISCORD_INTERACTION_TYPE) -> None:
@@ -189,6 +288,7 @@ class PyLavPlaylists(
         await context.pylav.playlist_db_manager.create_or_update_user_playlist(
             identifier=context.message.id, author=context.author.id, name=name, url=url, tracks=tracks
         )
+        self.name_index.add(context.message.id, name, context.author.id)
         await context.send(
             embed=await context.pylav.construct_embed(
                 title=_("I have created a new playlist."),
@@ -245,7 +345,7 @@ class PyLavPlaylists(
     async def slash_playlist_manage(
         self,
         interaction: DISCORD_INTERACTION_TYPE,
-        playlist: PlaylistConverter,
+        playlist: IndexedPlaylistConverter,
         operation: Literal["Info", "Save", "Play", "Delete"] = None,
     ):  # sourcery skip: low-code-quality
         if not interaction.response.is_done():
@@ -280,11 +380,11 @@ class PyLavPlaylists(
             await PaginatingMenu(
                 bot=self.bot,
                 cog=self,
-                source=TrackMappingSource(
+                source=PagedTrackMappingSource(
                     guild_id=context.guild.id,
                     cog=self,
                     author=context.author,
-                    entries=await playlist.fetch_tracks(),
+                    size=await playlist.size(),
                     playlist=playlist,
                 ),
                 delete_after_timeout=True,
@@ -353,6 +453,9 @@ class PyLavPlaylists(
             "**Author**:{space_variable_do_not_translate}{space_variable_do_not_translate}{author_variable_do_not_translate}\n"
             "**Tracks**:{space_variable_do_not_translate}{space_variable_do_not_translate}{space_variable_do_not_translate}{tracks_variable_do_not_translate} tracks\n"
             "**URL**:{space_variable_do_not_translate}{space_variable_do_not_translate}{space_variable_do_not_translate}{space_variable_do_not_translate}{space_variable_do_not_translate}{url_variable_do_not_translate}\n"
+            "**Duration**:{space_variable_do_not_translate}{duration_variable_do_not_translate}\n"
+            "**Sources**:{space_variable_do_not_translate}{sources_variable_do_not_translate}\n"
+            "**Refreshed**:{space_variable_do_not_translate}{refreshed_variable_do_not_translate}\n"
         )
         playlist_prompt = PlaylistManageFlow(
             cog=self,
@@ -372,7 +475,7 @@ class PyLavPlaylists(
                     playlist_name_variable_do_not_translate=name
                 )
             description = info_description + playlist_info
-
+            stats = await self.fetch_playlist_stats(playlist)
             description = description.format(
                 playlist_name_variable_do_not_translate=await playlist.get_name_formatted(with_url=True),
                 scope_variable_do_not_translate=await playlist.get_scope_name(
@@ -380,7 +483,14 @@ class PyLavPlaylists(
                 ),
                 author_variable_do_not_translate=await playlist.get_author_name(bot=self.bot, mention=True),
                 url_variable_do_not_translate=await playlist.fetch_url() or _("N/A"),
-                tracks_variable_do_not_translate=await playlist.size(),
+                tracks_variable_do_not_translate=stats.count,
+                duration_variable_do_not_translate=humanize_timedelta(seconds=stats.duration // 1000) or _("N/A"),
+                sources_variable_do_not_translate=(
+                    humanize_list([f"{source} ({count})" for source, count in stats.sources.items()])
+                    if stats.sources
+                    else _("N/A")
+                ),
+                refreshed_variable_do_not_translate=f"<t:{int(stats.refreshed)}:R>" if stats.refreshed else _("N/A"),
                 space_variable_do_not_translate="\N{EN SPACE}",
             )
 
@@ -414,21 +524,28 @@ class PyLavPlaylists(
                 ephemeral=True,
             )
             await playlist.delete()
+            await self._forget_playlist(playlist)
+            self.name_index.remove(playlist.id)
             return
         tracks_added = 0
         tracks_removed = 0
+        duplicates = []
         changed = False
         if manageable:
             if playlist_prompt.clear:
                 changed = True
                 await playlist.remove_all_tracks()
+                await self._update_playlist_stats(playlist, tracks=[])
             if playlist_prompt.name and playlist_prompt.name != await playlist.fetch_name():
                 changed = True
                 await playlist.update_name(playlist_prompt.name)
+                self.name_index.rename(playlist.id, playlist_prompt.name)
             if playlist_prompt.url and playlist_prompt.url != await playlist.fetch_url():
                 changed = True
                 await playlist.update_url(playlist_prompt.url)
             if (playlist_prompt.add_tracks or playlist_prompt.remove_prompt) and not playlist_prompt.update:
+                to_remove = set()
+                to_add = []
                 if playlist_prompt.remove_tracks:
                     response = await self.pylav.get_tracks(
                         *[await Query.from_string(at) for at in playlist_prompt.remove_tracks], player=context.player
@@ -443,11 +560,7 @@ class PyLavPlaylists(
                         case __:
                             tracks = []
                     tracks = typing.cast(collections.deque[Track_namespace_conflict], tracks)
-                    for t in tracks:
-                        b64 = t.encoded
-                        await playlist.remove_track(b64)
-                        changed = True
-                        tracks_removed += 1
+                    to_remove = {t.encoded for t in tracks if t.encoded}
                 if playlist_prompt.add_tracks:
                     response = await self.pylav.get_tracks(
                         *[await Query.from_string(at) for at in playlist_prompt.add_tracks],
@@ -462,26 +575,16 @@ class PyLavPlaylists(
                             tracks = response.data.tracks
                         case __:
                             tracks = []
-                    if tracks := typing.cast(collections.deque[Track_namespace_conflict], tracks):
-                        await playlist.add_track(list(tracks))
-                        changed = True
-                        tracks_added += sum(1 for __ in tracks)
+                    to_add = list(typing.cast(collections.deque[Track_namespace_conflict], tracks))
+                removed, added = await self._bulk_edit_playlist(playlist, remove=to_remove, add=to_add)
+                if removed or added:
+                    changed = True
+                    tracks_removed += removed
+                    tracks_added += added
         if playlist_prompt.update:
             if url := await playlist.fetch_url():
                 with contextlib.suppress(Exception):
-                    response = await self.pylav.get_tracks(
-                        await Query.from_string(url), bypass_cache=True, player=context.player
-                    )
-                    match response.loadType:
-                        case "track":
-                            tracks = [response.data]
-                        case "search":
-                            tracks = response.data
-                        case "playlist":
-                            tracks = response.data.tracks
-                        case __:
-                            tracks = []
-                    if not tracks:
+                    if (diff := await self._refresh_playlist(playlist, url, player=context.player)) is None:
                         await context.send(
                             embed=await context.pylav.construct_embed(
                                 messageable=context,
@@ -497,33 +600,25 @@ class PyLavPlaylists(
                             ephemeral=True,
                         )
                         return
-                    if b64_list := typing.cast(list[Track_namespace_conflict], [track for track in tracks if track.encoded]):  # type: ignore
+                    if diff:
                         changed = True
-                        await playlist.update_tracks(b64_list)
+                        tracks_added += len(diff.inserted)
+                        tracks_removed += len(diff.removed)
             elif playlist.id in BUNDLED_PLAYLIST_IDS:
                 changed = True
                 if playlist.id < 1000001:
                     await self.pylav.playlist_db_manager.update_bundled_playlists(playlist.id)
                 else:
                     await self.pylav.playlist_db_manager.update_bundled_external_playlists(playlist.id)
+                await self._forget_playlist(playlist)
         if manageable:
-            if playlist_prompt.dedupe:
-                track = await playlist.fetch_tracks()
-                new_tracks = [
-                    from_dict(data_class=Track_namespace_conflict, data=json.loads(t))
-                    for t in {json.dumps(d, sort_keys=True) for d in track}
-                ]
-                if diff := len(track) - len(new_tracks):
-                    changed = True
-                    await playlist.update_tracks(new_tracks)
-                    tracks_removed += diff
+            if playlist_prompt.dedupe and (duplicates := await self._dedupe_playlist(playlist)):
+                changed = True
+                tracks_removed += len(duplicates)
             if playlist_prompt.queue:
                 changed = True
                 if context.player:
-                    if tracks := context.player.queue.raw_queue:
-                        queue_tracks = [track._processed for track in tracks if track.encoded]
-                        await playlist.add_track(queue_tracks)
-                        tracks_added += len(queue_tracks)
+                    tracks_added += await self._save_queue_to_playlist(context.player, playlist)
 
         if changed:
             extras = ""
@@ -535,6 +630,8 @@ class PyLavPlaylists(
                         extras += _(
                             "\n{track_count_variable_do_not_translate} tracks were removed from the playlist."
                         ).format(track_count_variable_do_not_translate=tracks_removed)
+            if duplicates:
+                extras += self._format_duplicates(duplicates)
             if tracks_added:
                 match tracks_added:
                     case 1:
@@ -579,7 +676,7 @@ class PyLavPlaylists(
     @app_commands.describe(playlist=_("The playlist to enqueue"))
     @app_commands.guild_only()
     @invoker_is_dj(slash=True)
-    async def slash_playlist_play(self, interaction: DISCORD_INTERACTION_TYPE, playlist: PlaylistConverter):
+    async def slash_playlist_play(self, interaction: DISCORD_INTERACTION_TYPE, playlist: IndexedPlaylistConverter):
         if not interaction.response.is_done():
             await interaction.response.defer(ephemeral=True)
         context = await self.bot.get_context(interaction)
@@ -596,7 +693,7 @@ class PyLavPlaylists(
     )
     @app_commands.describe(playlist=_("The playlist to delete"))
     @app_commands.guild_only()
-    async def slash_playlist_delete(self, interaction: DISCORD_INTERACTION_TYPE, playlist: PlaylistConverter):
+    async def slash_playlist_delete(self, interaction: DISCORD_INTERACTION_TYPE, playlist: IndexedPlaylistConverter):
         if not interaction.response.is_done():
             await interaction.response.defer(ephemeral=True)
         context = await self.bot.get_context(interaction)
@@ -624,6 +721,8 @@ class PyLavPlaylists(
             )
             return
         await playlist.delete()
+        await self._forget_playlist(playlist)
+        self.name_index.remove(playlist.id)
         await context.send(
             embed=await context.pylav.construct_embed(
                 title=_("Playlist deleted"),
@@ -638,13 +737,458 @@ class PyLavPlaylists(
             ephemeral=True,
         )
 
+    @slash_playlist.command(
+        name="dedupe",
+        description=_("Remove duplicate tracks from a playlist"),
+    )
+    @app_commands.describe(
+        playlist=_("The playlist to remove duplicates from"),
+        fuzzy=_("Also treat tracks with the same title, author and duration as duplicates"),
+    )
+    @app_commands.guild_only()
+    async def slash_playlist_dedupe(
+        self, interaction: DISCORD_INTERACTION_TYPE, playlist: IndexedPlaylistConverter, fuzzy: bool = False
+    ):
+        if not interaction.response.is_done():
+            await interaction.response.defer(ephemeral=True)
+        context = await self.bot.get_context(interaction)
+
+        playlists: list[Playlist] = playlist
+        playlist = await maybe_prompt_for_playlist(cog=self, playlists=playlists, context=context)
+        if not playlist:
+            return
+        if playlist.id in BUNDLED_PLAYLIST_IDS or not await playlist.can_manage(bot=self.bot, requester=context.author):
+            await context.send(
+                embed=await context.pylav.construct_embed(
+                    messageable=context,
+                    description=_(
+                        "{user_variable_do_not_translate}, playlist {playlist_name_variable_do_not_translate} cannot be managed by yourself."
+                    ).format(
+                        user_variable_do_not_translate=context.author.mention,
+                        playlist_name_variable_do_not_translate=await playlist.get_name_formatted(with_url=True),
+                    ),
+                ),
+                ephemeral=True,
+            )
+            return
+        if not (duplicates := await self._dedupe_playlist(playlist, fuzzy=fuzzy)):
+            await context.send(
+                embed=await context.pylav.construct_embed(
+                    messageable=context,
+                    title=_("Playlist unchanged"),
+                    description=_(
+                        "{user_variable_do_not_translate}, playlist {playlist_name_variable_do_not_translate} has no duplicate tracks."
+                    ).format(
+                        user_variable_do_not_translate=context.author.mention,
+                        playlist_name_variable_do_not_translate=await playlist.get_name_formatted(with_url=True),
+                    ),
+                ),
+                ephemeral=True,
+            )
+            return
+        await context.send(
+            embed=await context.pylav.construct_embed(
+                messageable=context,
+                title=_("Playlist updated"),
+                description=_(
+                    "{user_variable_do_not_translate}, {track_count_variable_do_not_translate} duplicate tracks were removed from playlist {playlist_name_variable_do_not_translate}.{extras_variable_do_not_translate}"
+                ).format(
+                    user_variable_do_not_translate=context.author.mention,
+                    track_count_variable_do_not_translate=len(duplicates),
+                    playlist_name_variable_do_not_translate=await playlist.get_name_formatted(with_url=True),
+                    extras_variable_do_not_translate=self._format_duplicates(duplicates),
+                ),
+            ),
+            ephemeral=True,
+        )
+
+    async def _bulk_edit_playlist(
+        self, playlist: Playlist, remove: set[str], add: list[Track_namespace_conflict]
+    ) -> tuple[int, int]:
+        """Remove every track whose encoded value is in `remove` and append `add` in a single storage write
+
+        Returns the number of tracks removed and added.
+        """
+        if not remove:
+            if add:
+                await playlist.add_track(add)
+                await self._update_playlist_stats(playlist, added=add)
+            return 0, len(add)
+        kept, removed = remove_tracks(await playlist.fetch_tracks(), remove)
+        if removed or add:
+            await playlist.update_tracks(
+                [from_dict(data_class=Track_namespace_conflict, data=track) for track in kept] + add
+            )
+            await self._update_playlist_stats(playlist, added=add, removed=removed)
+        return len(removed), len(add)
+
+    async def _dedupe_playlist(self, playlist: Playlist, fuzzy: bool = False) -> list[dict]:
+        """Remove the repeated tracks of a playlist keeping the order of the first occurrences, returns the removed ones"""
+        kept, duplicates = dedupe_tracks(await playlist.fetch_tracks(), fuzzy=fuzzy)
+        if duplicates:
+            await playlist.update_tracks([from_dict(data_class=Track_namespace_conflict, data=track) for track in kept])
+            await self._update_playlist_stats(playlist, removed=duplicates)
+        return duplicates
+
+    async def _save_queue_to_playlist(self, player: Player, playlist: Playlist) -> int:
+        """Append the player queue to a playlist in chunks, yielding to the event loop between them"""
+        # Copying the references is cheap and keeps a consistent view if the queue changes while saving
+        snapshot = list(player.queue.raw_queue)
+        saved = 0
+        for start in range(0, len(snapshot), QUEUE_SAVE_CHUNK):
+            if chunk := [track._processed for track in snapshot[start : start + QUEUE_SAVE_CHUNK] if track.encoded]:
+                await playlist.add_track(chunk)
+                await self._update_playlist_stats(playlist, added=chunk)
+                saved += len(chunk)
+            await asyncio.sleep(0)
+        return saved
+
+    @staticmethod
+    def _loaded_tracks(response) -> list[Track_namespace_conflict]:
+        """The playable tracks of a node load response"""
+        match response.loadType:
+            case "track":
+                tracks = [response.data]
+            case "search":
+                tracks = response.data
+            case "playlist":
+                tracks = response.data.tracks
+            case __:
+                tracks = []
+        return [track for track in tracks if track.encoded]
+
+    async def _refresh_playlist(self, playlist: Playlist, url: str, player: Player | None = None) -> TrackDiff | None:
+        """Fetch the tracks of the URL a playlist is linked to and store only what changed
+
+        Returns None if the URL did not resolve to any track, in which case the playlist is left untouched.
+        """
+        response = await self.pylav.get_tracks(await Query.from_string(url), bypass_cache=True, player=player)
+        if not (fetched := self._loaded_tracks(response)):
+            return None
+        stored = await playlist.fetch_tracks()
+        diff = diff_tracks([track["encoded"] for track in stored], [track.encoded for track in fetched])
+        if diff.is_append(len(stored)):
+            await playlist.add_track([fetched[position] for position in diff.inserted])
+        elif diff:
+            await playlist.update_tracks(fetched)
+        await self._update_playlist_stats(
+            playlist,
+            added=[fetched[position] for position in diff.inserted],
+            removed=[stored[position] for position in diff.removed],
+            refreshed=True,
+        )
+        return diff
+
+    async def refresh_url_playlists(self) -> None:
+        """Refresh every playlist linked to a URL, a few at a time and spread over the refresh jitter"""
+        semaphore = asyncio.Semaphore(REFRESH_CONCURRENCY)
+
+        async def refresh(playlist: Playlist, url: str) -> None:
+            await asyncio.sleep(random.uniform(0, REFRESH_JITTER))
+            async with semaphore:
+                try:
+                    diff = await self._refresh_playlist(playlist, url)
+                except Exception as exc:
+                    LOGGER.warning("Failed to refresh playlist %s from %s", playlist.id, url, exc_info=exc)
+                    return
+            if diff:
+                LOGGER.debug(
+                    "Refreshed playlist %s: %s inserted, %s removed, %s moved",
+                    playlist.id,
+                    len(diff.inserted),
+                    len(diff.removed),
+                    len(diff.moved),
+                )
+
+        await asyncio.gather(
+            *[
+                refresh(playlist, url)
+                async for playlist in self.pylav.playlist_db_manager.get_all_playlists()
+                if playlist.id not in BUNDLED_PLAYLIST_IDS and (url := await playlist.fetch_url())
+            ]
+        )
+
+    def _schedule_refresh(self, hours: int) -> None:
+        with contextlib.suppress(JobLookupError):
+            self.pylav.scheduler.remove_job(f"{self.__class__.__name__}-{self.bot.user.id}-refresh_url_playlists")
+        if not hours:
+            return
+        self.pylav.scheduler.add_job(
+            self.refresh_url_playlists,
+            trigger="interval",
+            hours=hours,
+            jitter=REFRESH_JITTER,
+            max_instances=1,
+            id=f"{self.__class__.__name__}-{self.bot.user.id}-refresh_url_playlists",
+            replace_existing=True,
+            coalesce=True,
+        )
+
+    async def rebuild_name_index(self) -> None:
+        """Rebuild the playlist name index from storage"""
+        index = self.name_index.building = PlaylistNameIndex()
+        try:
+            async for playlist in self.pylav.playlist_db_manager.get_all_playlists():
+                index.load(playlist.id, await playlist.fetch_name(), await playlist.fetch_scope())
+        finally:
+            self.name_index.building = None
+        index.ready = True
+        self.name_index = index
+        LOGGER.debug("Indexed the names of %s playlists", len(index))
+
+    async def _forget_playlist(self, playlist: Playlist) -> None:
+        """Drop everything known about the tracks of a playlist that was deleted or written outside this cog"""
+        await self.invalidate_playlist(playlist.id)
+
+    async def invalidate_playlist(self, playlist_id: int) -> None:
+        """Drop everything known about the tracks of a playlist, for other cogs that write playlists directly"""
+        self._track_store.forget(playlist_id)
+        await self._config.custom(PLAYLIST_STATS, playlist_id).clear()
+
+    async def fetch_playlist_stats(self, playlist: Playlist) -> PlaylistStats:
+        """Return the materialized stats of a playlist, computing them from its tracks when missing or stale"""
+        group = self._config.custom(PLAYLIST_STATS, playlist.id)
+        refreshed = None
+        if (data := await group.stats()) is not None:
+            stats = PlaylistStats.from_dict(data)
+            if not stats.is_stale(await playlist.size()):
+                return stats
+            refreshed = stats.refreshed
+            # The playlist may have been written elsewhere, don't compute the stats from a stored copy
+            self._track_store.forget(playlist.id)
+        stats = PlaylistStats.from_tracks(await self._track_store.fetch_tracks(playlist), refreshed=refreshed)
+        await group.stats.set(stats.to_dict())
+        return stats
+
+    async def _update_playlist_stats(
+        self,
+        playlist: Playlist,
+        *,
+        added: Iterable[typing.Any] = (),
+        removed: Iterable[typing.Any] = (),
+        tracks: Iterable[typing.Any] | None = None,
+        refreshed: bool = False,
+    ) -> None:
+        """Apply a change of the tracks of a playlist to its stats, or replace them if all its tracks are given
+
+        Must be called after every write to the tracks of a playlist, it also drops them from the shared track store.
+        """
+        self._track_store.forget(playlist.id)
+        group = self._config.custom(PLAYLIST_STATS, playlist.id)
+        data = await group.stats()
+        if tracks is not None:
+            stats = PlaylistStats.from_tracks(tracks, refreshed=data["refreshed"] if data else None)
+        elif data is None:
+            # Nothing materialized yet, the stats will be computed in full the next time they are needed
+            return
+        else:
+            stats = PlaylistStats.from_dict(data)
+            stats.add(added)
+            stats.remove(removed)
+        if refreshed:
+            stats.refreshed = time.time()
+        await group.stats.set(stats.to_dict())
+
+    @staticmethod
+    def _format_duplicates(duplicates: list[dict], limit: int = 10) -> str:
+        titles = collections.Counter(track_title(track) for track in duplicates)
+        names = [
+            (
+                f"{shorten_string(max_length=50, string=title)} (x{count})"
+                if count > 1
+                else shorten_string(max_length=50, string=title)
+            )
+            for title, count in itertools.islice(titles.items(), limit)
+        ]
+        if len(titles) > limit:
+            names.append(
+                _("{count_variable_do_not_translate} more").format(count_variable_do_not_translate=len(titles) - limit)
+            )
+        return _("\nDuplicates removed: {tracks_variable_do_not_translate}").format(
+            tracks_variable_do_not_translate=humanize_list(names)
+        )
+
+    @slash_playlist.command(name="union", description=_("Combine playlists, keeping every track once"))
+    @app_commands.describe(
+        first=_("The first playlist"),
+        second=_("The second playlist"),
+        third=_("An optional third playlist"),
+        into=_("An existing playlist to overwrite with the result, a new playlist is created if not specified"),
+        name=_("The name of the new playlist"),
+    )
+    @app_commands.guild_only()
+    async def slash_playlist_union(
+        self,
+        interaction: DISCORD_INTERACTION_TYPE,
+        first: IndexedPlaylistConverter,
+        second: IndexedPlaylistConverter,
+        third: IndexedPlaylistConverter = None,
+        into: IndexedPlaylistConverter = None,
+        name: str = None,
+    ):
+        await self._combine_playlists(interaction, "union", [first, second, third], into=into, name=name)
+
+    @slash_playlist.command(
+        name="intersect", description=_("Keep the tracks of the first playlist that are in all the others")
+    )
+    @app_commands.describe(
+        first=_("The first playlist"),
+        second=_("The second playlist"),
+        third=_("An optional third playlist"),
+        into=_("An existing playlist to overwrite with the result, a new playlist is created if not specified"),
+        name=_("The name of the new playlist"),
+    )
+    @app_commands.guild_only()
+    async def slash_playlist_intersect(
+        self,
+        interaction: DISCORD_INTERACTION_TYPE,
+        first: IndexedPlaylistConverter,
+        second: IndexedPlaylistConverter,
+        third: IndexedPlaylistConverter = None,
+        into: IndexedPlaylistConverter = None,
+        name: str = None,
+    ):
+        await self._combine_playlists(interaction, "intersect", [first, second, third], into=into, name=name)
+
+    @slash_playlist.command(
+        name="difference", description=_("Keep the tracks of the first playlist that are in none of the others")
+    )
+    @app_commands.describe(
+        first=_("The first playlist"),
+        second=_("The second playlist"),
+        third=_("An optional third playlist"),
+        into=_("An existing playlist to overwrite with the result, a new playlist is created if not specified"),
+        name=_("The name of the new playlist"),
+    )
+    @app_commands.guild_only()
+    async def slash_playlist_difference(
+        self,
+        interaction: DISCORD_INTERACTION_TYPE,
+        first: IndexedPlaylistConverter,
+        second: IndexedPlaylistConverter,
+        third: IndexedPlaylistConverter = None,
+        into: IndexedPlaylistConverter = None,
+        name: str = None,
+    ):
+        await self._combine_playlists(interaction, "difference", [first, second, third], into=into, name=name)
+
+    @slash_playlist.command(
+        name="merge", description=_("Merge playlists, removing tracks with the same title, author and duration")
+    )
+    @app_commands.describe(
+        first=_("The first playlist"),
+        second=_("The second playlist"),
+        third=_("An optional third playlist"),
+        into=_("An existing playlist to overwrite with the result, a new playlist is created if not specified"),
+        name=_("The name of the new playlist"),
+    )
+    @app_commands.guild_only()
+    async def slash_playlist_merge(
+        self,
+        interaction: DISCORD_INTERACTION_TYPE,
+        first: IndexedPlaylistConverter,
+        second: IndexedPlaylistConverter,
+        third: IndexedPlaylistConverter = None,
+        into: IndexedPlaylistConverter = None,
+        name: str = None,
+    ):
+        await self._combine_playlists(interaction, "merge", [first, second, third], into=into, name=name)
+
+    async def _combine_playlists(
+        self,
+        interaction: DISCORD_INTERACTION_TYPE,
+        operation: Literal["union", "intersect", "difference", "merge"],
+        sources: list[list[Playlist] | None],
+        into: list[Playlist] | None = None,
+        name: str | None = None,
+    ) -> None:
+        if not interaction.response.is_done():
+            await interaction.response.defer(ephemeral=True)
+        context = await self.bot.get_context(interaction)
+
+        playlists = []
+        for candidates in sources:
+            if candidates is None:
+                continue
+            if not (playlist := await maybe_prompt_for_playlist(cog=self, playlists=candidates, context=context)):
+                return
+            playlists.append(playlist)
+        target = None
+        if into is not None:
+            if not (target := await maybe_prompt_for_playlist(cog=self, playlists=into, context=context)):
+                return
+            if target.id in BUNDLED_PLAYLIST_IDS or not await target.can_manage(bot=self.bot, requester=context.author):
+                await context.send(
+                    embed=await context.pylav.construct_embed(
+                        messageable=context,
+                        description=_(
+                            "{user_variable_do_not_translate}, playlist {playlist_name_variable_do_not_translate} cannot be managed by yourself."
+                        ).format(
+                            user_variable_do_not_translate=context.author.mention,
+                            playlist_name_variable_do_not_translate=await target.get_name_formatted(with_url=True),
+                        ),
+                    ),
+                    ephemeral=True,
+                )
+                return
+
+        payloads = {}
+        references = []
+        for playlist in playlists:
+            # The result may be written back over one of the sources, so none of them can be a stale copy
+            playlist_references, playlist_tracks = await self._track_store.load(playlist, fresh=True)
+            payloads.update(zip(playlist_references, playlist_tracks))
+            references.append(playlist_references)
+        match operation:
+            case "union":
+                result = [payloads[reference] for reference in union_references(*references)]
+            case "intersect":
+                result = [payloads[reference] for reference in intersect_references(*references)]
+            case "difference":
+                result = [payloads[reference] for reference in difference_references(*references)]
+            case __:
+                result, __ = dedupe_tracks(
+                    (payloads[reference] for reference in itertools.chain.from_iterable(references)), fuzzy=True
+                )
+        tracks = [from_dict(data_class=Track_namespace_conflict, data=track) for track in result]
+        if target is not None:
+            await target.update_tracks(tracks)
+            await self._update_playlist_stats(target, tracks=result)
+            description = _(
+                "Playlist {playlist_name_variable_do_not_translate} now has {track_count_variable_do_not_translate} tracks."
+            ).format(
+                playlist_name_variable_do_not_translate=await target.get_name_formatted(with_url=True),
+                track_count_variable_do_not_translate=len(tracks),
+            )
+        else:
+            name = name or f"{context.message.id}"
+            await context.pylav.playlist_db_manager.create_or_update_user_playlist(
+                identifier=context.message.id, author=context.author.id, name=name, url=None, tracks=tracks
+            )
+            self.name_index.add(context.message.id, name, context.author.id)
+            description = _(
+                "Name: `{name_variable_do_not_translate}`\nIdentifier: `{id_variable_do_not_translate}`\nTracks: `{track_count_variable_do_not_translate}`"
+            ).format(
+                name_variable_do_not_translate=name,
+                id_variable_do_not_translate=context.message.id,
+                track_count_variable_do_not_translate=len(tracks),
+            )
+        await context.send(
+            embed=await context.pylav.construct_embed(
+                title=_("Playlist updated") if target is not None else _("I have created a new playlist."),
+                description=description,
+                messageable=context,
+            ),
+            ephemeral=True,
+        )
+
     @slash_playlist.command(
         name="info",
         description=_("Display info about a playlist"),
     )
     @app_commands.describe(playlist=_("The playlist show info about"))
     @app_commands.guild_only()
-    async def slash_playlist_info(self, interaction: DISCORD_INTERACTION_TYPE, playlist: PlaylistConverter):
+    async def slash_playlist_info(self, interaction: DISCORD_INTERACTION_TYPE, playlist: IndexedPlaylistConverter):
         if not interaction.response.is_done():
             await interaction.response.defer(ephemeral=True)
         context = await self.bot.get_context(interaction)
@@ -657,11 +1201,11 @@ class PyLavPlaylists(
         await PaginatingMenu(
             bot=self.bot,
             cog=self,
-            source=TrackMappingSource(
+            source=PagedTrackMappingSource(
                 guild_id=context.guild.id,
                 cog=self,
                 author=context.author,
-                entries=await playlist.fetch_tracks(),
+                size=await playlist.size(),
                 playlist=playlist,
             ),
             delete_after_timeout=True,
@@ -673,7 +1217,7 @@ class PyLavPlaylists(
     @app_commands.describe(playlist=_("The playlist to append the queue to"))
     @app_commands.guild_only()
     @requires_player(slash=True)
-    async def slash_playlist_save(self, interaction: DISCORD_INTERACTION_TYPE, playlist: PlaylistConverter):
+    async def slash_playlist_save(self, interaction: DISCORD_INTERACTION_TYPE, playlist: IndexedPlaylistConverter):
         if not interaction.response.is_done():
             await interaction.response.defer(ephemeral=True)
         context = await self.bot.get_context(interaction)
@@ -711,12 +1255,8 @@ class PyLavPlaylists(
             return
         tracks_added = 0
         changed = False
-        if context.player:
-            if tracks := context.player.queue.raw_queue:
-                queue_tracks = [track._processed for track in tracks if track.encoded]
-                await playlist.add_track(queue_tracks)
-                tracks_added += len(queue_tracks)
-                changed = True
+        if context.player and (tracks_added := await self._save_queue_to_playlist(context.player, playlist)):
+            changed = True
         if changed:
             extras = ""
             if tracks_added:
@@ -811,7 +1351,7 @@ class PyLavPlaylists(
         saved_playlists = []
         for url in valid_playlist_urls:
             try:
-                playlist = await Playlist.from_yaml(context=context, url=url, scope=context.author.id)
+                playlist = await self._import_playlist(context, url)
                 saved_playlists.append(f"{bold(await playlist.fetch_name())} ({playlist.id})")
             except InvalidPlaylistException:
                 invalid_playlists_urls.add(url)
@@ -844,6 +1384,43 @@ class PyLavPlaylists(
             ephemeral=True,
         )
 
+    async def _import_playlist(self, context: PyLavContext, url: str) -> Playlist:
+        """Import a playlist file chunk by chunk, editing a progress message as tracks are saved"""
+        importer = PlaylistImporter(
+            self.pylav, url, identifier=context.message.id, scope=context.author.id, author=context.author.id
+        )
+        message = await context.send(
+            embed=await context.pylav.construct_embed(messageable=context, description=_("Importing playlist...")),
+            ephemeral=True,
+        )
+        last_update = time.monotonic()
+
+        async def on_progress(imported: int, invalid: int) -> None:
+            nonlocal last_update
+            if message is None or time.monotonic() - last_update < IMPORT_PROGRESS_INTERVAL:
+                return
+            last_update = time.monotonic()
+            with contextlib.suppress(discord.HTTPException):
+                await message.edit(
+                    embed=await context.pylav.construct_embed(
+                        messageable=context,
+                        description=_(
+                            "Importing playlist, {imported_variable_do_not_translate} tracks saved and {invalid_variable_do_not_translate} invalid tracks skipped so far..."
+                        ).format(
+                            imported_variable_do_not_translate=imported, invalid_variable_do_not_translate=invalid
+                        ),
+                    )
+                )
+
+        try:
+            playlist = await importer.run(on_progress)
+            self.name_index.add(playlist.id, await playlist.fetch_name(), context.author.id)
+            return playlist
+        finally:
+            if message is not None:
+                with contextlib.suppress(discord.HTTPException):
+                    await message.delete()
+
     @slash_playlist.command(name="mix", description=_("Play a YouTube mix playlist from a input"))
     @app_commands.describe(
         video=_("The YouTube video ID to play a mix from"),
@@ -865,7 +1442,16 @@ class PyLavPlaylists(
             context = await self.bot.get_context(context)
         if context.interaction and not context.interaction.response.is_done():
             await context.defer(ephemeral=True)
-        if not any([video, playlist, user, channel]):
+        # Read before `channel` is reused for the voice channel below
+        mix = next(
+            (
+                (seed, source)
+                for source, seed in (("video", video), ("playlist", playlist), ("user", user), ("channel", channel))
+                if seed
+            ),
+            None,
+        )
+        if mix is None:
             await context.send(
                 embed=await self.pylav.construct_embed(
                     description=_("You need to give me a parameter to use."),
@@ -903,11 +1489,7 @@ class PyLavPlaylists(
                 return
             player = await self.pylav.connect_player(channel=channel, requester=context.author)
         try:
-            query = await Query.from_string(
-                await self.pylav.generate_mix_playlist(
-                    video_id=video, playlist_id=playlist, user_id=user, channel_id=channel
-                )
-            )
+            query, tracks = await self._mix_cache.get(*mix)
         except PyLavInvalidArgumentsException as e:
             await context.send(
                 embed=await self.pylav.construct_embed(
@@ -917,15 +1499,18 @@ class PyLavPlaylists(
                 ephemeral=True,
             )
             return
-        total_tracks_enqueue = 0
         single_track = None
-        single_track, total_tracks_enqueue = await self._process_play_queries(
-            context, [query], player, single_track, total_tracks_enqueue
-        )
+        if built := await self._build_playlist_tracks(player, context.author.id, tracks):
+            single_track = built[0]
+            await player.bulk_add(requester=context.author.id, tracks_and_queries=built)
         if not (player.is_active or player.queue.empty()):
             await player.next(requester=context.author)
 
-        await self._process_play_message(context, single_track, total_tracks_enqueue, [query])
+        await self._process_play_message(context, single_track, len(built), [query])
+
+    async def _resolve_mix(self, seed: str, source: str) -> tuple[Query, list[Track_namespace_conflict]]:
+        query = await Query.from_string(await self.pylav.generate_mix_playlist(**{f"{source}_id": seed}))
+        return query, self._loaded_tracks(await self.pylav.get_tracks(query))
 
     async def _process_play_message(self, context, single_track, total_tracks_enqueue, queries):
         artwork = None
@@ -1029,18 +1614,18 @@ class PyLavPlaylists(
                 return
             player = await context.connect_player(channel=channel)
         track_count = await playlist.size()
-
-        tracks = await playlist.fetch_tracks()
-        track_objects = [from_dict(data_class=Track_namespace_conflict, data=track) for track in tracks]
-        await player.bulk_add(
-            requester=context.author.id,
-            tracks_and_queries=[
-                await Track.build_track(
-                    node=player.node, data=track, requester=context.author.id, query=None, player_instance=player
-                )
-                for track in track_objects
-            ],
-        )
+        if track_count > LAZY_ENQUEUE_THRESHOLD or self._windows.get(context.guild.id):
+            # Only a window of the playlist is kept in the queue, it is refilled as the queue drains.
+            # Smaller playlists wait behind the windows already queued so that they keep their place.
+            tracks = []
+            self._windows[context.guild.id].append(PlaylistWindow.from_size(playlist, context.author.id, track_count))
+            await self._refill_playlist_window(player)
+        else:
+            tracks = await self._track_store.fetch_tracks(playlist)
+        # Start playing as soon as the first track is built, the rest is appended while it plays
+        enqueued = await self._enqueue_playlist_tracks(player, context.author.id, tracks[:1]) if tracks else 0
+        if not player.is_active:
+            await player.next(requester=context.author)
         bundle_prefix = _("Playlist")
         playlist_name = f"\n\n**{bundle_prefix}**:  {await playlist.get_name_formatted(with_url=True)}"
         await context.send(
@@ -1055,6 +1640,102 @@ class PyLavPlaylists(
             ),
             ephemeral=True,
         )
-
+        for start in range(1, len(tracks), PLAYLIST_ENQUEUE_CHUNK):
+            enqueued += await self._enqueue_playlist_tracks(
+                player, context.author.id, tracks[start : start + PLAYLIST_ENQUEUE_CHUNK]
+            )
+        if enqueued < len(tracks):
+            LOGGER.debug("Failed to build %s of the %s tracks of %s", len(tracks) - enqueued, len(tracks), playlist)
         if not player.is_active:
             await player.next(requester=context.author)
+
+    async def _build_playlist_tracks(
+        self, player: Player, requester: int, tracks: list[dict | Track_namespace_conflict]
+    ) -> list[Track]:
+        """Build a chunk of stored or loaded tracks concurrently, in order, skipping the ones that fail"""
+        semaphore = asyncio.Semaphore(PLAYLIST_BUILD_CONCURRENCY)
+
+        async def build(track: dict | Track_namespace_conflict) -> Track:
+            async with semaphore:
+                return await Track.build_track(
+                    node=player.node,
+                    data=(
+                        from_dict(data_class=Track_namespace_conflict, data=track) if isinstance(track, dict) else track
+                    ),
+                    requester=requester,
+                    query=None,
+                    player_instance=player,
+                )
+
+        built = await asyncio.gather(*(build(track) for track in tracks), return_exceptions=True)
+        for result in built:
+            if isinstance(result, Exception):
+                LOGGER.debug("Failed to build a playlist track", exc_info=result)
+        return [track for track in built if not isinstance(track, BaseException)]
+
+    async def _enqueue_playlist_tracks(self, player: Player, requester: int, tracks: list[dict]) -> int:
+        if not (built := await self._build_playlist_tracks(player, requester, tracks)):
+            return 0
+        await player.bulk_add(requester=requester, tracks_and_queries=built)
+        return len(built)
+
+    async def _refill_playlist_window(self, player: Player) -> int:
+        """Materialize the next tracks of the windowed playlists of the player once its queue runs low"""
+        guild_id = player.guild.id
+        async with self._window_locks[guild_id]:
+            if not (windows := self._windows.get(guild_id)) or player.queue.size() >= WINDOW_SIZE // 2:
+                return 0
+            wanted = WINDOW_SIZE - player.queue.size()
+            enqueued = 0
+            while windows and wanted > 0:
+                window = windows[0]
+                if (
+                    not window.shuffle
+                    and await self.pylav.player_config_manager.get_config(guild_id).fetch_auto_shuffle()
+                ):
+                    window.shuffle = True
+                    window.rewind()
+                if window.needs_load:
+                    # The whole playlist is read, but only the next few windows of it are kept
+                    window.fill(await window.playlist.fetch_tracks())
+                consumed, tracks = window.pop(wanted)
+                wanted -= consumed
+                if not len(window):
+                    windows.popleft()
+                if tracks:
+                    enqueued += await self._enqueue_playlist_tracks(player, window.requester, tracks)
+            if not windows:
+                self._windows.pop(guild_id, None)
+            return enqueued
+
+    @commands.Cog.listener()
+    async def on_pylav_track_start(self, event: TrackStartEvent) -> None:
+        await self._refill_playlist_window(event.player)
+
+    @commands.Cog.listener()
+    async def on_pylav_track_skipped_event(self, event: TrackSkippedEvent) -> None:
+        await self._refill_playlist_window(event.player)
+
+    @commands.Cog.listener()
+    async def on_pylav_queue_tracks_removed_event(self, event: QueueTracksRemovedEvent) -> None:
+        await self._refill_playlist_window(event.player)
+
+    @commands.Cog.listener()
+    async def on_pylav_queue_shuffled_event(self, event: QueueShuffledEvent) -> None:
+        for window in self._windows.get(event.player.guild.id, ()):
+            window.shuffle = True
+            window.rewind()
+
+    @commands.Cog.listener()
+    async def on_pylav_queue_end_event(self, event: QueueEndEvent) -> None:
+        player = event.player
+        if await self._refill_playlist_window(player) and not player.is_active:
+            await player.next()
+
+    @commands.Cog.listener()
+    async def on_pylav_player_stopped_event(self, event: PlayerStoppedEvent) -> None:
+        self._windows.pop(event.player.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_pylav_player_disconnected_event(self, event: PlayerDisconnectedEvent) -> None:
+        self._windows.pop(event.player.guild.id, None)
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import asyncio
+import gzip
+import tempfile
+import zlib
+from collections.abc import Awaitable, Callable, Iterator
+from itertools import islice
+from typing import IO, TYPE_CHECKING
+
+import aiohttp
+import yaml
+from dacite import from_dict
+
+from pylav.exceptions.playlist import InvalidPlaylistException
+from pylav.logging import getLogger
+from pylav.nodes.api.responses.track import Track as Track_namespace_conflict
+from pylav.storage.models.playlist import Playlist
+
+if TYPE_CHECKING:
+    from pylav.core.client import Client
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from pylav.players.tracks.decoder import decode_track
+except ImportError:
+    decode_track = None
+
+LOGGER = getLogger("PyLav.cog.Playlists.Importer")
+
+IMPORT_CHUNK_SIZE = 500
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Uploads smaller than this are kept in memory, bigger ones are spooled to disk
+SPOOL_SIZE = 4 * 1024 * 1024
+GZIP_MAGIC = b"\x1f\x8b"
+TRACK = "track"
+
+
+def decode_blobs(blobs: list[str | None]) -> list[Track_namespace_conflict | None]:
+    """Decode base64 tracks locally, None for the ones that are missing or invalid
+
+    Also used by the Migrator cog for the tracks Audio stored with its playlists.
+    """
+    decoded = []
+    for blob in blobs:
+        try:
+            track = decode_track(blob) if blob else None
+        except Exception:  # noqa
+            track = None
+        decoded.append(track if track is not None and track.encoded and track.info else None)
+    return decoded
+
+
+def iter_playlist_yaml(stream: IO[bytes]) -> Iterator[tuple[str, object]]:
+    """Parse a playlist file one node at a time
+
+    Yields ("track", track) for every entry of the track list and (key, value) for every other top level field,
+    so that only a single track is ever constructed at once.
+    """
+    loader = yaml.SafeLoader(stream)
+    try:
+        loader.get_event()
+        if not loader.check_event(yaml.DocumentStartEvent):
+            raise ValueError("The playlist file is empty")
+        loader.get_event()
+        if not loader.check_event(yaml.MappingStartEvent):
+            raise ValueError("The playlist file is not a mapping")
+        loader.get_event()
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = loader.construct_object(loader.compose_node(None, None), deep=True)
+            if key != "tracks" or not loader.check_event(yaml.SequenceStartEvent):
+                yield key, loader.construct_object(loader.compose_node(None, None), deep=True)
+                continue
+            loader.get_event()
+            while not loader.check_event(yaml.SequenceEndEvent):
+                yield TRACK, loader.construct_object(loader.compose_node(None, None), deep=True)
+                # The constructor caches every object of the document, drop them as the tracks are consumed
+                loader.constructed_objects.clear()
+            loader.get_event()
+    finally:
+        loader.dispose()
+
+
+class PlaylistImporter:
+    """Imports a playlist file in chunks, so memory use does not grow with the size of the playlist"""
+
+    def __init__(self, client: Client, url: str, identifier: int, scope: int, author: int) -> None:
+        self.client = client
+        self.url = url
+        self.identifier = identifier
+        self.scope = scope
+        self.author = author
+        self.imported = 0
+        self.invalid = 0
+
+    async def _download(self) -> tuple[IO[bytes], IO[bytes]]:
+        """Download the file, returning the stream to parse and the underlying file, both must be closed"""
+        file = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        decompressor = brotli.Decompressor() if brotli is not None and ".br." in self.url else None
+        try:
+            async with aiohttp.ClientSession() as session, session.get(self.url) as response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    file.write(decompressor.process(chunk) if decompressor is not None else chunk)
+        except Exception:
+            file.close()
+            raise
+        file.seek(0)
+        if file.read(2) == GZIP_MAGIC:
+            file.seek(0)
+            return gzip.GzipFile(fileobj=file), file
+        file.seek(0)
+        return file, file
+
+    async def _validate(self, tracks: list[object]) -> list[Track_namespace_conflict | None]:
+        """Validate a chunk of tracks, the ones only stored as base64 are decoded together"""
+        validated: list[Track_namespace_conflict | None] = [None] * len(tracks)
+        blobs: dict[int, str] = {}
+        for position, track in enumerate(tracks):
+            if isinstance(track, dict) and isinstance(track.get("info"), dict):
+                try:
+                    validated[position] = from_dict(data_class=Track_namespace_conflict, data=track)
+                    continue
+                except Exception:  # noqa
+                    track = track.get("encoded")
+            elif isinstance(track, dict):
+                track = track.get("encoded")
+            if isinstance(track, str):
+                blobs[position] = track
+        if not blobs:
+            return validated
+        if decode_track is not None:
+            decoded = await asyncio.to_thread(decode_blobs, list(blobs.values()))
+        else:
+            decoded = []
+            for blob in blobs.values():
+                try:
+                    decoded.append(await self.client.decode_track(blob, raise_on_failure=True))
+                except Exception:  # noqa
+                    decoded.append(None)
+        for position, track in zip(blobs, decoded):
+            validated[position] = track
+        return validated
+
+    async def run(self, on_progress: Callable[[int, int], Awaitable[None]] | None = None) -> Playlist:
+        """Import the playlist, calling `on_progress` with the imported and skipped counts after every chunk
+
+        Raises InvalidPlaylistException if the file cannot be downloaded or parsed, nothing is saved in that case.
+        """
+        try:
+            file, raw = await self._download()
+        except (aiohttp.ClientError, OSError) as exc:
+            raise InvalidPlaylistException(f"Failed to download {self.url}") from exc
+        fields = {}
+        playlist = None
+        items = iter_playlist_yaml(file)
+        try:
+            while batch := await asyncio.to_thread(lambda: list(islice(items, IMPORT_CHUNK_SIZE))):
+                fields.update((key, value) for key, value in batch if key != TRACK)
+                validated = await self._validate([value for key, value in batch if key == TRACK])
+                tracks = [track for track in validated if track is not None]
+                self.invalid += len(validated) - len(tracks)
+                if tracks and playlist is None:
+                    playlist = await self.client.playlist_db_manager.create_or_update_playlist(
+                        identifier=self.identifier,
+                        name=fields.get("name") or f"{self.identifier}",
+                        scope=self.scope,
+                        author=self.author,
+                        url=fields.get("url"),
+                        tracks=tracks,
+                    )
+                elif tracks:
+                    await playlist.add_track(tracks)
+                self.imported += len(tracks)
+                if on_progress is not None:
+                    await on_progress(self.imported, self.invalid)
+        except (yaml.YAMLError, OSError, EOFError, zlib.error, ValueError) as exc:
+            # Without access to the storage transaction, undo the chunks already written
+            if playlist is not None:
+                await playlist.delete()
+            raise InvalidPlaylistException(f"Invalid playlist file {self.url}") from exc
+        finally:
+            # Closing a GzipFile leaves the file it wraps open
+            file.close()
+            raw.close()
+        if playlist is None and not fields and not self.invalid:
+            raise InvalidPlaylistException(f"Invalid playlist file {self.url}")
+        if playlist is None:
+            return await self.client.playlist_db_manager.create_or_update_playlist(
+                identifier=self.identifier,
+                name=fields.get("name") or f"{self.identifier}",
+                scope=self.scope,
+                author=self.author,
+                url=fields.get("url"),
+                tracks=[],
+            )
+        # Fields dumped after the track list are only known once the whole file has been read
+        if (name := fields.get("name")) and name != await playlist.fetch_name():
+            await playlist.update_name(name)
+        if (url := fields.get("url")) and url != await playlist.fetch_url():
+            await playlist.update_url(url)
+        LOGGER.debug("Imported %s tracks from %s, skipped %s invalid tracks", self.imported, self.url, self.invalid)
+        return playlist
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import asyncio
+import collections
+import time
+from collections.abc import Awaitable, Callable
+
+from pylav.logging import getLogger
+from pylav.nodes.api.responses.track import Track as Track_namespace_conflict
+from pylav.players.query.obj import Query
+
+LOGGER = getLogger("PyLav.cog.Playlists.Mixes")
+
+# Seconds a resolved mix is served from memory
+MIX_TTL = 3600
+# Seconds before expiry at which a requested mix is resolved again in the background
+MIX_REFRESH_AHEAD = 600
+MAX_MIXES = 256
+
+MixKey = tuple[str, str]
+MixResolver = Callable[[str, str], Awaitable[tuple[Query, list[Track_namespace_conflict]]]]
+
+
+class MixCache:
+    """Resolved mix tracks keyed by (seed, source)
+
+    Entries close to expiry are served as they are while a fresh copy is resolved in the background, so popular
+    seeds never wait on the node.
+    """
+
+    def __init__(
+        self,
+        resolve: MixResolver,
+        ttl: float = MIX_TTL,
+        refresh_ahead: float = MIX_REFRESH_AHEAD,
+        max_entries: int = MAX_MIXES,
+    ) -> None:
+        self.resolve = resolve
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.max_entries = max_entries
+        self._entries: collections.OrderedDict[MixKey, tuple[float, Query, list[Track_namespace_conflict]]] = (
+            collections.OrderedDict()
+        )
+        self._refreshing: dict[MixKey, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _store(self, key: MixKey, query: Query, tracks: list[Track_namespace_conflict]) -> None:
+        if not tracks:
+            return
+        self._entries[key] = (time.monotonic(), query, tracks)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _refresh(self, key: MixKey) -> None:
+        try:
+            self._store(key, *await self.resolve(*key))
+        except Exception as exc:
+            # The cached copy keeps being served until it expires
+            LOGGER.debug("Failed to refresh the %s mix for %s", key[1], key[0], exc_info=exc)
+        finally:
+            self._refreshing.pop(key, None)
+
+    async def get(self, seed: str, source: str) -> tuple[Query, list[Track_namespace_conflict]]:
+        """Return the query and resolved tracks of a mix, resolving it only if it is not cached or has expired"""
+        key = (seed, source)
+        if (entry := self._entries.get(key)) is not None:
+            age = time.monotonic() - entry[0]
+            if age < self.ttl:
+                self._entries.move_to_end(key)
+                if age >= self.ttl - self.refresh_ahead and key not in self._refreshing:
+                    self._refreshing[key] = asyncio.create_task(self._refresh(key))
+                return entry[1], entry[2]
+            del self._entries[key]
+        query, tracks = await self.resolve(seed, source)
+        self._store(key, query, tracks)
+        return query, tracks
+
+    def clear(self) -> None:
+        for task in self._refreshing.values():
+            task.cancel()
+        self._refreshing.clear()
+        self._entries.clear()
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import collections
+import re
+from collections.abc import Iterable
+
+import discord
+from discord import app_commands
+from rapidfuzz import fuzz, process
+
+from pylav.helpers.discord.converters.playlists import PlaylistConverter
+from pylav.logging import getLogger
+from pylav.storage.models.playlist import Playlist
+
+LOGGER = getLogger("PyLav.cog.Playlists.Names")
+
+REGEX_PUNCTUATION = re.compile(r"[\W_]+")
+SCORE_CUTOFF = 70
+MAX_MATCHES = 25
+
+
+def normalize(name: str) -> str:
+    return re.sub(REGEX_PUNCTUATION, " ", name).casefold().strip()
+
+
+class PlaylistNameIndex:
+    """Playlist names grouped by scope, so lookups only ever look at the scopes visible to the requester"""
+
+    def __init__(self) -> None:
+        self.ready = False
+        # scope -> playlist id -> (normalized name, display name)
+        self._scopes: collections.defaultdict[int, dict[int, tuple[str, str]]] = collections.defaultdict(dict)
+        # scope -> normalized name -> playlist ids
+        self._exact: collections.defaultdict[int, collections.defaultdict[str, set[int]]] = collections.defaultdict(
+            lambda: collections.defaultdict(set)
+        )
+        self._scope_of: dict[int, int] = {}
+        # The index being rebuilt to replace this one, changes made meanwhile are applied to it too
+        self.building: PlaylistNameIndex | None = None
+        # Playlists changed while this index was being built, storage may have returned them before the change
+        self._changed: set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._scope_of)
+
+    def add(self, playlist_id: int, name: str, scope: int) -> None:
+        """Add a playlist, or update its name and scope if it is already indexed"""
+        self.remove(playlist_id)
+        self._add(playlist_id, name, scope)
+        if self.building is not None:
+            self.building.add(playlist_id, name, scope)
+            self.building._changed.add(playlist_id)
+
+    def load(self, playlist_id: int, name: str, scope: int) -> None:
+        """Add a playlist read from storage while building, unless it was changed since the build started"""
+        if playlist_id not in self._changed:
+            self.add(playlist_id, name, scope)
+
+    def _add(self, playlist_id: int, name: str, scope: int) -> None:
+        normalized = normalize(name)
+        self._scopes[scope][playlist_id] = (normalized, name)
+        self._exact[scope][normalized].add(playlist_id)
+        self._scope_of[playlist_id] = scope
+
+    def remove(self, playlist_id: int) -> None:
+        if self.building is not None:
+            self.building.remove(playlist_id)
+            self.building._changed.add(playlist_id)
+        if (scope := self._scope_of.pop(playlist_id, None)) is None:
+            return
+        normalized, __ = self._scopes[scope].pop(playlist_id)
+        self._exact[scope][normalized].discard(playlist_id)
+        if not self._exact[scope][normalized]:
+            del self._exact[scope][normalized]
+
+    def rename(self, playlist_id: int, name: str) -> None:
+        if (scope := self._scope_of.get(playlist_id)) is not None:
+            self.add(playlist_id, name, scope)
+
+    def clear(self) -> None:
+        self.ready = False
+        self.building = None
+        self._changed.clear()
+        self._scopes.clear()
+        self._exact.clear()
+        self._scope_of.clear()
+
+    def _name(self, playlist_id: int) -> str:
+        return self._scopes[self._scope_of[playlist_id]][playlist_id][1]
+
+    def search(self, current: str, scopes: Iterable[int], limit: int = MAX_MATCHES) -> list[tuple[int, str]]:
+        """Return the (id, name) of the playlists in the given scopes matching the input, best match first
+
+        An exact id or name match is returned on its own, fuzzy matching is only used if there is none.
+        """
+        scopes = [scope for scope in scopes if scope in self._scopes]
+        if current.isdigit() and (scope := self._scope_of.get(int(current))) in scopes:
+            return [(int(current), self._name(int(current)))]
+        normalized = normalize(current)
+        if exact := [
+            (playlist_id, self._name(playlist_id))
+            for scope in scopes
+            for playlist_id in self._exact[scope].get(normalized, ())
+        ]:
+            return exact[:limit]
+        choices = {playlist_id: entry[0] for scope in scopes for playlist_id, entry in self._scopes[scope].items()}
+        if not normalized:
+            return [(playlist_id, self._name(playlist_id)) for playlist_id in list(choices)[:limit]]
+        return [
+            (playlist_id, self._name(playlist_id))
+            for __, __, playlist_id in process.extract(
+                normalized, choices, scorer=fuzz.WRatio, limit=limit, score_cutoff=SCORE_CUTOFF
+            )
+        ]
+
+
+def visible_scopes(interaction: discord.Interaction) -> set[int]:
+    """The scopes whose playlists the user of an interaction can see"""
+    scopes = {interaction.client.user.id, interaction.user.id}
+    if interaction.guild is not None:
+        scopes.add(interaction.guild.id)
+    if interaction.channel is not None:
+        scopes.add(interaction.channel.id)
+    if (voice := getattr(interaction.user, "voice", None)) is not None and voice.channel is not None:
+        scopes.add(voice.channel.id)
+    return scopes
+
+
+class IndexedPlaylistConverter(app_commands.Transformer):
+    """Resolves playlist arguments through the playlist cog's name index, falling back to PyLav's converter"""
+
+    @staticmethod
+    def _index(interaction: discord.Interaction) -> PlaylistNameIndex | None:
+        if (cog := interaction.client.get_cog("PyLavPlaylists")) is None or not cog.name_index.ready:
+            return None
+        return cog.name_index
+
+    async def transform(self, interaction: discord.Interaction, value: str) -> list[Playlist]:
+        if (index := self._index(interaction)) is not None and (
+            matches := index.search(value, visible_scopes(interaction))
+        ):
+            manager = interaction.client.pylav.playlist_db_manager
+            playlists = []
+            for playlist_id, __ in matches:
+                # The index can be behind storage, skip playlists that were deleted elsewhere
+                try:
+                    playlist = await manager.get_playlist_by_id(playlist_id)
+                except Exception as exc:
+                    LOGGER.debug("Indexed playlist %s no longer resolves", playlist_id, exc_info=exc)
+                    playlist = None
+                if playlist is None:
+                    index.remove(playlist_id)
+                else:
+                    playlists.append(playlist)
+            if playlists:
+                return playlists
+        return await PlaylistConverter().transform(interaction, value)
+
+    async def autocomplete(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+        if (index := self._index(interaction)) is None:
+            return await PlaylistConverter().autocomplete(interaction, current)
+        return [
+            app_commands.Choice(name=f"{name[:90]} ({playlist_id})"[:100], value=f"{playlist_id}")
+            for playlist_id, name in index.search(current, visible_scopes(interaction))
+        ]
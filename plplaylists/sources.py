@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import asyncio
+
+from pylav.extension.red.ui.sources.playlist import TrackMappingSource
+from pylav.storage.models.playlist import Playlist
+
+
+class PlaylistTrackPages:
+    """Serves the pages of a playlist menu from a single read of its tracks, made when the first page is shown"""
+
+    def __init__(self, playlist: Playlist, per_page: int) -> None:
+        self.playlist = playlist
+        self.per_page = per_page
+        self._tracks: asyncio.Task[list[dict]] | None = None
+
+    async def get(self, page_number: int) -> list[dict]:
+        """Return the tracks of a menu page"""
+        # Playlists only expose full reads, so every page of the menu shares the same one unless it failed
+        if self._tracks is None or (
+            self._tracks.done() and (self._tracks.cancelled() or self._tracks.exception() is not None)
+        ):
+            self._tracks = asyncio.create_task(self.playlist.fetch_tracks())
+        tracks = await asyncio.shield(self._tracks)
+        return tracks[page_number * self.per_page : (page_number + 1) * self.per_page]
+
+
+class PagedTrackMappingSource(TrackMappingSource):
+    """A TrackMappingSource that reads the playlist tracks when a page is first shown instead of up front"""
+
+    def __init__(self, *, size: int, playlist: Playlist, **kwargs) -> None:
+        super().__init__(entries=range(size), playlist=playlist, **kwargs)
+        self.pages = PlaylistTrackPages(playlist, self.per_page)
+
+    async def get_page(self, page_number: int) -> list[dict]:
+        return await self.pages.get(page_number)
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import collections
+import dataclasses
+import time
+from collections.abc import Iterable
+from typing import Any
+
+PLAYLIST_STATS = "PLAYLIST_STATS"
+# Seconds after which stats are computed again from the tracks, so writes made outside this cog are picked up
+STATS_MAX_AGE = 3600
+
+
+def track_summary(track: Any) -> tuple[int, str, bool]:
+    """The duration in milliseconds, source name and stream flag of a stored (dict) or decoded track"""
+    if isinstance(track, dict):
+        info = track.get("info") or {}
+        return info.get("length") or 0, info.get("sourceName") or "unknown", bool(info.get("isStream"))
+    info = getattr(track, "info", None)
+    return (
+        getattr(info, "length", None) or 0,
+        getattr(info, "sourceName", None) or "unknown",
+        bool(getattr(info, "isStream", False)),
+    )
+
+
+@dataclasses.dataclass(slots=True)
+class PlaylistStats:
+    """Summary of a playlist's tracks, kept up to date as tracks are added and removed"""
+
+    count: int = 0
+    # Milliseconds, streams are not counted
+    duration: int = 0
+    streams: int = 0
+    sources: dict[str, int] = dataclasses.field(default_factory=dict)
+    refreshed: float | None = None
+    # When the stats were last computed from all the tracks, incremental updates keep it
+    computed_at: float | None = None
+
+    @classmethod
+    def from_tracks(cls, tracks: Iterable[Any], refreshed: float | None = None) -> PlaylistStats:
+        stats = cls(refreshed=refreshed, computed_at=time.time())
+        stats.add(tracks)
+        return stats
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> PlaylistStats:
+        return cls(**data)
+
+    def to_dict(self) -> dict[str, Any]:
+        return dataclasses.asdict(self)
+
+    def is_stale(self, size: int, max_age: float = STATS_MAX_AGE) -> bool:
+        """Whether the stats must be computed again for a playlist that currently has `size` tracks"""
+        return self.count != size or self.computed_at is None or time.time() - self.computed_at > max_age
+
+    def _apply(self, tracks: Iterable[Any], sign: int) -> None:
+        sources = collections.Counter(self.sources)
+        for track in tracks:
+            length, source, is_stream = track_summary(track)
+            self.count += sign
+            if is_stream:
+                self.streams += sign
+            else:
+                self.duration += sign * length
+            sources[source] += sign
+        self.sources = {source: count for source, count in sources.most_common() if count > 0}
+
+    def add(self, tracks: Iterable[Any]) -> None:
+        self._apply(tracks, 1)
+
+    def remove(self, tracks: Iterable[Any]) -> None:
+        self._apply(tracks, -1)
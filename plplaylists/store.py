@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import collections
+import hashlib
+import time
+from array import array
+from collections.abc import Iterable
+
+from pylav.storage.models.playlist import Playlist
+
+# Number of track references kept across all playlists, least recently used playlists are dropped first
+MAX_TRACKS = 50_000
+# Seconds after which a playlist is read again, so writes made outside this cog are picked up
+MAX_AGE = 300
+
+
+def track_hash(encoded: str) -> int:
+    """A 64-bit content address for an encoded track"""
+    return int.from_bytes(hashlib.blake2b(encoded.encode(), digest_size=8).digest(), "big", signed=True)
+
+
+class SharedTrackStore:
+    """Interns playlist tracks by the hash of their encoded value
+
+    Every track payload is held once no matter how many playlists contain it, playlists only hold an array of
+    64-bit references into the store.
+    """
+
+    def __init__(self, max_tracks: int = MAX_TRACKS, max_age: float = MAX_AGE) -> None:
+        self.max_tracks = max_tracks
+        self.max_age = max_age
+        self._size = 0
+        self._tracks: dict[int, dict] = {}
+        self._counts: collections.Counter[int] = collections.Counter()
+        self._playlists: collections.OrderedDict[int, tuple[float, array[int]]] = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._tracks)
+
+    def _intern(self, track: dict) -> int:
+        key = track_hash(track["encoded"])
+        # Probe past the (astronomically unlikely) collisions so that different tracks never share a reference
+        while (existing := self._tracks.get(key)) is not None and existing["encoded"] != track["encoded"]:
+            key += 1
+        if existing is None:
+            self._tracks[key] = track
+        self._counts[key] += 1
+        return key
+
+    def _release(self, references: array[int]) -> None:
+        for key in references:
+            self._counts[key] -= 1
+            if not self._counts[key]:
+                del self._counts[key]
+                del self._tracks[key]
+
+    def put(self, playlist_id: int, tracks: Iterable[dict]) -> tuple[array[int], list[dict]]:
+        """Intern the tracks of a playlist and remember its references, returns its references and payloads"""
+        references = array("q", (self._intern(track) for track in tracks))
+        payloads = self.resolve(references)
+        self.forget(playlist_id)
+        if len(references) > self.max_tracks:
+            # A playlist bigger than the whole budget is handed out without being kept, nor evicting anything
+            self._release(references)
+            return references, payloads
+        self._playlists[playlist_id] = (time.monotonic(), references)
+        self._size += len(references)
+        while self._size > self.max_tracks:
+            __, (__, evicted) = self._playlists.popitem(last=False)
+            self._size -= len(evicted)
+            self._release(evicted)
+        return references, payloads
+
+    def forget(self, playlist_id: int) -> None:
+        """Drop a playlist, must be called whenever its tracks are written"""
+        if (entry := self._playlists.pop(playlist_id, None)) is not None:
+            self._size -= len(entry[1])
+            self._release(entry[1])
+
+    def clear(self) -> None:
+        self._playlists.clear()
+        self._tracks.clear()
+        self._counts.clear()
+        self._size = 0
+
+    def get(self, playlist_id: int) -> array[int] | None:
+        if (entry := self._playlists.get(playlist_id)) is None:
+            return None
+        if time.monotonic() - entry[0] > self.max_age:
+            self.forget(playlist_id)
+            return None
+        self._playlists.move_to_end(playlist_id)
+        return entry[1]
+
+    def resolve(self, references: Iterable[int]) -> list[dict]:
+        """Return the track payloads for an array of references"""
+        return [self._tracks[key] for key in references]
+
+    async def load(self, playlist: Playlist, fresh: bool = False) -> tuple[array[int], list[dict]]:
+        """Return the references and payloads of the tracks of a playlist, reading it from storage if it is not known
+
+        The stored copy can be up to `max_age` seconds old, callers that write the playlist back must pass `fresh`.
+        Payloads shared with other playlists are the same objects.
+        """
+        if not fresh and (references := self.get(playlist.id)) is not None:
+            return references, self.resolve(references)
+        return self.put(playlist.id, await playlist.fetch_tracks())
+
+    async def fetch_tracks(self, playlist: Playlist, fresh: bool = False) -> list[dict]:
+        """Return the tracks of a playlist, payloads shared with other playlists are the same objects"""
+        return (await self.load(playlist, fresh=fresh))[1]
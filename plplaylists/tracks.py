@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import bisect
+import collections
+import dataclasses
+import itertools
+import re
+from collections.abc import Iterable
+
+REGEX_PUNCTUATION = re.compile(r"[\W_]+")
+
+
+def _normalize(string: str | None) -> str:
+    return re.sub(REGEX_PUNCTUATION, " ", string or "").casefold().strip()
+
+
+def track_key(track: dict, fuzzy: bool = False) -> str | tuple[str, str, int]:
+    """The identity of a stored track, its encoded value or, if fuzzy, its title, author and duration in seconds"""
+    if not fuzzy:
+        return track["encoded"]
+    info = track.get("info") or {}
+    if not (title := _normalize(info.get("title"))):
+        return track["encoded"]
+    return title, _normalize(info.get("author")), round((info.get("length") or 0) / 1000)
+
+
+def track_title(track: dict) -> str:
+    info = track.get("info") or {}
+    return info.get("title") or info.get("uri") or track["encoded"][:16]
+
+
+def dedupe_tracks(tracks: Iterable[dict], fuzzy: bool = False) -> tuple[list[dict], list[dict]]:
+    """Keep the first occurrence of every track in order, returns the kept tracks and the removed duplicates"""
+    seen = set()
+    kept, duplicates = [], []
+    for track in tracks:
+        if (key := track_key(track, fuzzy)) in seen:
+            duplicates.append(track)
+        else:
+            seen.add(key)
+            kept.append(track)
+    return kept, duplicates
+
+
+def remove_tracks(tracks: Iterable[dict], encoded: set[str]) -> tuple[list[dict], list[dict]]:
+    """Split stored tracks into the ones to keep and the ones whose encoded value is in `encoded`, keeping order"""
+    kept, removed = [], []
+    for track in tracks:
+        (removed if track["encoded"] in encoded else kept).append(track)
+    return kept, removed
+
+
+def _longest_increasing_run(values: list[int]) -> set[int]:
+    """Return the indexes of one longest strictly increasing subsequence of `values`"""
+    tails: list[int] = []
+    tail_indexes: list[int] = []
+    previous = [-1] * len(values)
+    for index, value in enumerate(values):
+        slot = bisect.bisect_left(tails, value)
+        if slot == len(tails):
+            tails.append(value)
+            tail_indexes.append(index)
+        else:
+            tails[slot] = value
+            tail_indexes[slot] = index
+        previous[index] = tail_indexes[slot - 1] if slot else -1
+    run = set()
+    index = tail_indexes[-1] if tail_indexes else -1
+    while index != -1:
+        run.add(index)
+        index = previous[index]
+    return run
+
+
+@dataclasses.dataclass(slots=True)
+class TrackDiff:
+    """The changes turning a stored track list into a fetched one"""
+
+    # Positions in the fetched list
+    inserted: list[int] = dataclasses.field(default_factory=list)
+    # Positions in the stored list
+    removed: list[int] = dataclasses.field(default_factory=list)
+    # Positions in the fetched list of tracks that are in both lists but changed their relative order
+    moved: list[int] = dataclasses.field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.inserted or self.removed or self.moved)
+
+    def is_append(self, stored_size: int) -> bool:
+        """Whether the only change is tracks added after the end of the stored list"""
+        return not (self.removed or self.moved) and self.inserted == list(
+            range(stored_size, stored_size + len(self.inserted))
+        )
+
+
+def diff_tracks(stored: list[str], fetched: list[str]) -> TrackDiff:
+    """Compare two lists of encoded tracks, repeated tracks are paired up in order of appearance"""
+    occurrences: collections.defaultdict[str, collections.deque[int]] = collections.defaultdict(collections.deque)
+    for position, encoded in enumerate(stored):
+        occurrences[encoded].append(position)
+    diff = TrackDiff()
+    matched = []
+    for position, encoded in enumerate(fetched):
+        if queue := occurrences.get(encoded):
+            matched.append((position, queue.popleft()))
+        else:
+            diff.inserted.append(position)
+    diff.removed = sorted(itertools.chain.from_iterable(occurrences.values()))
+    # The biggest group of tracks kept in the same relative order stays in place, everything else has moved
+    in_place = _longest_increasing_run([stored_position for __, stored_position in matched])
+    diff.moved = [position for index, (position, __) in enumerate(matched) if index not in in_place]
+    return diff
+
+
+def union_references(*playlists: Iterable[int]) -> list[int]:
+    """Every track present in any of the playlists once, in order of first appearance"""
+    return list(dict.fromkeys(itertools.chain.from_iterable(playlists)))
+
+
+def intersect_references(first: Iterable[int], *others: Iterable[int]) -> list[int]:
+    """The tracks of the first playlist present in every other one, once each and in the first playlist's order"""
+    common = set(first).intersection(*others)
+    return [reference for reference in dict.fromkeys(first) if reference in common]
+
+
+def difference_references(first: Iterable[int], *others: Iterable[int]) -> list[int]:
+    """The tracks of the first playlist present in none of the other ones, once each and in order"""
+    excluded = set().union(*others)
+    return [reference for reference in dict.fromkeys(first) if reference not in excluded]
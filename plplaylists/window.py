@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import collections
+import dataclasses
+import random
+from array import array
+
+from pylav.storage.models.playlist import Playlist
+
+WINDOW_SIZE = 50
+# Playlists with more tracks than this are enqueued through a window instead of all at once
+LAZY_ENQUEUE_THRESHOLD = 1000
+# Number of windows buffered per read of the stored playlist, so the whole playlist is only loaded every few refills
+LOAD_WINDOWS = 10
+
+
+@dataclasses.dataclass(slots=True)
+class PlaylistWindow:
+    """A cursor into a stored playlist, only the tracks in front of it are materialized in the player queue"""
+
+    playlist: Playlist
+    requester: int
+    order: array[int]
+    cursor: int = 0
+    shuffle: bool = False
+    # (position, stored track) pairs taken from the order but not materialized yet, in order
+    buffer: collections.deque[tuple[int, dict | None]] = dataclasses.field(default_factory=collections.deque)
+
+    @classmethod
+    def from_size(cls, playlist: Playlist, requester: int, size: int) -> PlaylistWindow:
+        return cls(playlist=playlist, requester=requester, order=array("I", range(size)))
+
+    def __len__(self) -> int:
+        """The number of tracks that have not been materialized yet"""
+        return len(self.order) - self.cursor + len(self.buffer)
+
+    @property
+    def needs_load(self) -> bool:
+        return not self.buffer and self.cursor < len(self.order)
+
+    def take(self, count: int) -> list[int]:
+        """Advance the cursor, returning the positions in the stored playlist of the next tracks to materialize
+
+        Once the queue has been shuffled, every pick is drawn uniformly from the tracks not materialized yet
+        (an incremental Fisher-Yates shuffle), which is the same as having shuffled the whole playlist.
+        """
+        end = min(self.cursor + count, len(self.order))
+        if self.shuffle:
+            for position in range(self.cursor, end):
+                swap = random.randrange(position, len(self.order))
+                self.order[position], self.order[swap] = self.order[swap], self.order[position]
+        positions = self.order[self.cursor : end].tolist()
+        self.cursor = end
+        return positions
+
+    def fill(self, tracks: list[dict], count: int = WINDOW_SIZE * LOAD_WINDOWS) -> None:
+        """Buffer the stored tracks of the next positions, `tracks` is the whole stored playlist"""
+        for position in self.take(count):
+            self.buffer.append((position, tracks[position] if position < len(tracks) else None))
+
+    def pop(self, count: int) -> tuple[int, list[dict]]:
+        """Return how many positions were consumed from the buffer and their stored tracks that still exist"""
+        entries = [self.buffer.popleft() for __ in range(min(count, len(self.buffer)))]
+        return len(entries), [track for __, track in entries if track is not None]
+
+    def rewind(self) -> None:
+        """Return the buffered positions to the order, so that a shuffle draws from them again"""
+        self.cursor -= len(self.buffer)
+        self.buffer.clear()
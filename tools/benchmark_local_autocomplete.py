@@ -0,0 +1,157 @@
+"""Benchmark /local autocomplete against synthetic local libraries.
+
+Usage: python tools/benchmark_local_autocomplete.py [--sizes 1000 10000 100000 500000] [--queries 50]
+
+Requires the cog dependencies (Red and PyLav) to be installed, no bot or node is started.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import os
+import pathlib
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+from unittest import mock
+
+from tabulate import tabulate
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent))
+
+from pllocal.cog import PyLavLocalFiles  # noqa: E402
+from pllocal.index import normalize  # noqa: E402
+
+WORDS = (
+    "love night dream fire heart blue light dance rain moon summer gold shadow river wild sky home road "
+    "star time ghost city paradise electric silver ocean storm sun echo black angel crystal midnight"
+).split()
+EXTENSIONS = (".mp3", ".flac", ".m4a", ".ogg", ".opus", ".wav")
+
+
+class FakeQuery:
+    def __init__(self, path: str) -> None:
+        self._query = path
+
+    async def query_to_string(self, max_length: int = 90, **kwargs) -> str:
+        name = os.path.splitext(os.path.basename(self._query))[0]
+        return name if len(name) <= max_length else f"{name[: max_length - 1]}…"
+
+
+class FakeLocalTracksCache:
+    def __init__(self, paths: list[str]) -> None:
+        self.path_to_track = {path: FakeQuery(path) for path in paths}
+        self.hexdigest_to_query = {
+            hashlib.md5(path.encode()).hexdigest(): query for path, query in self.path_to_track.items()
+        }
+        self.is_ready = True
+
+
+def words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(WORDS).title() for __ in range(count))
+
+
+def make_library(root: pathlib.Path, size: int, rng: random.Random) -> list[str]:
+    """Create the folders of an Artist/Album/NN - Title library on disk and return the folder and file paths"""
+    paths = []
+    while len(paths) < size:
+        artist = root / f"{words(rng, rng.randint(1, 3))} {rng.randint(1, 9999)}"
+        for album_number in range(rng.randint(1, 6)):
+            album = artist / f"{words(rng, rng.randint(1, 4))} ({rng.randint(1960, 2024)})"
+            if rng.random() < 0.2:
+                album = album / f"Disc {album_number + 1}"
+            album.mkdir(parents=True, exist_ok=True)
+            paths.append(str(album))
+            for track_number in range(1, rng.randint(6, 20)):
+                paths.append(
+                    str(album / f"{track_number:02d} - {words(rng, rng.randint(1, 5))}{rng.choice(EXTENSIONS)}")
+                )
+        paths.append(str(artist))
+    return paths[:size]
+
+
+def keystrokes(paths: list[str], count: int, rng: random.Random) -> list[str]:
+    """Pick words from real entries and return every prefix a user would type for them"""
+    typed = []
+    for path in rng.sample(paths, min(count, len(paths))):
+        target = " ".join(os.path.splitext(os.path.basename(path))[0].split()[-2:]).lower()
+        typed.extend(target[:end] for end in range(1, len(target) + 1))
+    return typed
+
+
+async def benchmark(size: int, queries: int, seed: int) -> list:
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as folder:
+        root = pathlib.Path(folder) / "localtracks"
+        paths = make_library(root, size, rng)
+        cache = FakeLocalTracksCache(paths)
+        config = SimpleNamespace(fetch_localtrack_folder=mock.AsyncMock(return_value=str(root)))
+        client = SimpleNamespace(local_tracks_cache=cache, lib_db_manager=SimpleNamespace(get_config=lambda: config))
+        bot = SimpleNamespace(pylav=client)
+        with (
+            mock.patch("pllocal.cog.Config"),
+            mock.patch("pllocal.cog.cog_data_path", return_value=pathlib.Path(folder)),
+        ):
+            cog = PyLavLocalFiles(bot)
+            tracemalloc.start()
+            start = time.perf_counter()
+            await cog.rebuild_local_index()
+            build_time = time.perf_counter() - start
+            __, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            interaction = SimpleNamespace(user=SimpleNamespace(id=1))
+            latencies = []
+            reused = 0
+            for current in keystrokes(paths, queries, rng):
+                # Whether this keystroke only has to score the matches of the previous one again
+                memo = cog._autocomplete_memo.get(interaction.user.id)
+                reused += memo is not None and memo.covers(cog._local_index, normalize(current))
+                start = time.perf_counter()
+                await cog.slash_local_autocomplete_entry(interaction, current)
+                latencies.append((time.perf_counter() - start) * 1000)
+            await cog.cog_unload()
+    percentiles = statistics.quantiles(latencies, n=100)
+    return [
+        f"{size:,}",
+        len(latencies),
+        f"{statistics.median(latencies):.2f}",
+        f"{percentiles[98]:.2f}",
+        f"{reused / len(latencies):.0%}",
+        f"{peak / 1024 / 1024:.1f}",
+        f"{build_time:.2f}",
+    ]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 500_000])
+    parser.add_argument("--queries", type=int, default=50, help="Number of entries typed out one keystroke at a time")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rows = [await benchmark(size, args.queries, args.seed) for size in args.sizes]
+    print(
+        tabulate(
+            rows,
+            headers=(
+                "Entries",
+                "Keystrokes",
+                "p50 (ms)",
+                "p99 (ms)",
+                "Memo reuse",
+                "Peak build memory (MiB)",
+                "Index build (s)",
+            ),
+            tablefmt="fancy_grid",
+        )
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())